@@ -0,0 +1,12 @@
+import logging
+import os
+
+# Timings depend on the machine and its load, the latency budgets are
+# only checked with BENCHMARK_TIMINGS=1, e.g. on a dedicated runner
+TIMINGS = bool(os.getenv("BENCHMARK_TIMINGS"))
+
+# throughput numbers are reported here, they are shown with the timings
+logger = logging.getLogger(__name__)
+if TIMINGS:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
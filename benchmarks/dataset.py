@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+
+from library.management.commands.seed_scale import seed_scale
+
+PASSWORD = "benchmark-password"
+SEED = 42
+
+
+def seed_dataset(scale=1):
+    """
+    Creates scale * (50 books, 20 users, 200 borrowings) with their
+    payments and returns the users ordered by id.
+    """
+    seed_scale(
+        books=50 * scale,
+        users=20 * scale,
+        borrowings=200 * scale,
+        seed=SEED,
+        password=PASSWORD,
+    )
+    return list(get_user_model().objects.order_by("id"))
@@ -0,0 +1,119 @@
+import os
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from benchmarks import logger
+from library.models import Book
+from library_config.celery import app
+from library_config.testing import TestCase
+from payment.fake_events import checkout_session_completed, signed_event
+from payment.models import Payment
+
+CYCLES = int(os.getenv("BENCHMARK_CHECKOUT_CYCLES", 30))
+WEBHOOK_SECRET = "whsec_benchmark"
+
+
+@override_settings(
+    PAYMENT_GATEWAY={
+        "BACKEND": "payment.gateways.FakeGateway",
+        "OPTIONS": {
+            "latency": float(os.getenv("BENCHMARK_GATEWAY_LATENCY", 0)),
+        },
+    },
+    STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET,
+)
+class CheckoutFlowTests(TestCase):
+    """
+    Borrow, pay and return through the API against the fake payment
+    gateway, with Celery tasks run in the process.
+    BENCHMARK_CHECKOUT_CYCLES sets the number of cycles and
+    BENCHMARK_GATEWAY_LATENCY the seconds every gateway call takes, the
+    cycles per second are shown with BENCHMARK_TIMINGS=1.
+    """
+
+    def setUp(self):
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, "task_always_eager", False)
+        # no Telegram deliveries, the messages stay in the outbox
+        patcher = mock.patch("notifications.outbox.drain_outbox")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.book = Book.objects.create(
+            title="Benchmark book",
+            author="Benchmark author",
+            cover="H",
+            inventory=CYCLES,
+            daily=1,
+        )
+        self.client = APIClient()
+        self.webhook = APIClient()
+
+    def borrow(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("borrowing:borrowing-list"),
+                {
+                    "book": self.book.id,
+                    "expected_return_date": (
+                        timezone.localdate() + timedelta(days=3)
+                    ),
+                },
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def pay(self, borrowing_id):
+        payment = Payment.objects.get(borrowing_id=borrowing_id)
+        payload, signature = signed_event(
+            checkout_session_completed(payment.session_id), WEBHOOK_SECRET
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.webhook.post(
+                reverse("payment:stripe-webhook"),
+                payload,
+                content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=signature,
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def give_back(self, borrowing_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse("borrowing:borrowing-detail", args=[borrowing_id])
+                + "return/"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_borrow_pay_return_cycles(self):
+        users = [
+            get_user_model().objects.create_user(
+                f"reader{number}@benchmark.com"
+            )
+            for number in range(CYCLES)
+        ]
+
+        started = time.perf_counter()
+        for user in users:
+            self.client.force_authenticate(user)
+            borrowing_id = self.borrow()
+            self.pay(borrowing_id)
+            self.give_back(borrowing_id)
+        elapsed = time.perf_counter() - started
+
+        logger.info(
+            "Borrow/pay/return cycles per second: %.0f", CYCLES / elapsed
+        )
+        self.assertEqual(
+            Payment.objects.filter(status="PAID").count(), CYCLES
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, CYCLES)
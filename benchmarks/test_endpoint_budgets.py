@@ -0,0 +1,531 @@
+import json
+import math
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from benchmarks import TIMINGS
+from benchmarks.dataset import PASSWORD, seed_dataset
+from borrowing.models import Borrowing
+from library.models import Book
+from library_config.testing import TestCase
+from payment.fake_events import checkout_session_completed, signed_event
+from payment.models import Payment
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+SCALE = int(os.getenv("BENCHMARK_SCALE", 1))
+ITERATIONS = int(os.getenv("BENCHMARK_ITERATIONS", 20))
+UPDATE_BASELINE = bool(os.getenv("BENCHMARK_UPDATE_BASELINE"))
+WEBHOOK_SECRET = "whsec_benchmark"
+
+
+def png_bytes():
+    image = BytesIO()
+    Image.new("RGB", (10, 10), "navy").save(image, format="PNG")
+    return image.getvalue()
+
+
+COVER = png_bytes()
+BULK_CSV = (
+    b"title,author,cover,inventory,daily\n"
+    b"Bulk benchmark book,Benchmark author,H,3,1.00\n"
+)
+
+
+def json_body(build):
+    return lambda t, n: {"data": build(t, n), "format": "json"}
+
+
+def book_payload(t, n):
+    return {
+        "title": f"Benchmark book {n}",
+        "author": "Benchmark author",
+        "cover": "H",
+        "inventory": 10,
+        "daily": "1.00",
+    }
+
+
+def borrowing_payload(t, n):
+    return {
+        "book": t.book.id,
+        "expected_return_date": timezone.localdate() + timedelta(days=3),
+    }
+
+
+def cover_upload(t, n):
+    return {
+        "data": {
+            "image": SimpleUploadedFile("cover.png", COVER, "image/png")
+        },
+        "format": "multipart",
+    }
+
+
+def cover_in_one_chunk(t, n):
+    return {
+        "data": COVER,
+        "content_type": "application/octet-stream",
+        "HTTP_CONTENT_RANGE": f"bytes 0-{len(COVER) - 1}/{len(COVER)}",
+    }
+
+
+def bulk_upload(t, n):
+    return {
+        "data": {
+            "file": SimpleUploadedFile("books.csv", BULK_CSV, "text/csv")
+        },
+        "format": "multipart",
+    }
+
+
+def stripe_event(t, n):
+    payload, signature = signed_event(
+        checkout_session_completed(f"cs_benchmark_{n}"), WEBHOOK_SECRET
+    )
+    return {
+        "data": payload,
+        "content_type": "application/json",
+        "HTTP_STRIPE_SIGNATURE": signature,
+    }
+
+
+# (name, method, client role, url, request arguments for the n-th
+# request). The url is built for every request, so routes that delete
+# or return something take a new object each time
+ENDPOINTS = (
+    ("books-list", "get", None, lambda t: reverse("library:book-list"), None),
+    (
+        "books-list-fields",
+        "get",
+        None,
+        lambda t: reverse("library:book-list") + "?fields=id,title,inventory",
+        None,
+    ),
+    (
+        "books-create",
+        "post",
+        "admin",
+        lambda t: reverse("library:book-list"),
+        json_body(book_payload),
+    ),
+    (
+        "books-detail",
+        "get",
+        "admin",
+        lambda t: reverse("library:book-detail", args=[t.book.id]),
+        None,
+    ),
+    (
+        "books-update",
+        "put",
+        "admin",
+        lambda t: reverse("library:book-detail", args=[t.book.id]),
+        json_body(book_payload),
+    ),
+    (
+        "books-partial-update",
+        "patch",
+        "admin",
+        lambda t: reverse("library:book-detail", args=[t.book.id]),
+        json_body(lambda t, n: {"daily": "1.50"}),
+    ),
+    (
+        "books-delete",
+        "delete",
+        "admin",
+        lambda t: reverse(
+            "library:book-detail", args=[t.spare_books.pop()]
+        ),
+        None,
+    ),
+    (
+        "books-borrowings",
+        "get",
+        "admin",
+        lambda t: reverse("library:book-borrowings", args=[t.book.id]),
+        None,
+    ),
+    (
+        "books-inventory",
+        "patch",
+        "admin",
+        lambda t: reverse("library:book-update-inventory", args=[t.book.id]),
+        json_body(lambda t, n: {"inventory": 10}),
+    ),
+    (
+        "books-upload-image",
+        "post",
+        "admin",
+        lambda t: reverse("library:book-upload-image", args=[t.book.id]),
+        cover_upload,
+    ),
+    (
+        "books-upload-image-chunked",
+        "put",
+        "admin",
+        lambda t: reverse(
+            "library:book-upload-image-chunk", args=[t.book.id]
+        ),
+        cover_in_one_chunk,
+    ),
+    (
+        "books-bulk-export",
+        "get",
+        "admin",
+        lambda t: reverse("library:book-bulk"),
+        None,
+    ),
+    (
+        "books-bulk-import",
+        "post",
+        "admin",
+        lambda t: reverse("library:book-bulk"),
+        bulk_upload,
+    ),
+    (
+        "borrowings-list-user",
+        "get",
+        "user",
+        lambda t: reverse("borrowing:borrowing-list"),
+        None,
+    ),
+    (
+        "borrowings-list-admin",
+        "get",
+        "admin",
+        lambda t: reverse("borrowing:borrowing-list"),
+        None,
+    ),
+    (
+        "borrowings-create",
+        "post",
+        "reader",
+        lambda t: reverse("borrowing:borrowing-list"),
+        json_body(borrowing_payload),
+    ),
+    (
+        "borrowings-detail-user",
+        "get",
+        "user",
+        lambda t: reverse(
+            "borrowing:borrowing-detail", args=[t.borrowing.id]
+        ),
+        None,
+    ),
+    (
+        "borrowings-detail-admin",
+        "get",
+        "admin",
+        lambda t: reverse(
+            "borrowing:borrowing-detail", args=[t.borrowing.id]
+        ),
+        None,
+    ),
+    (
+        "borrowings-update",
+        "put",
+        "admin",
+        lambda t: reverse(
+            "borrowing:borrowing-detail", args=[t.borrowing.id]
+        ),
+        json_body(borrowing_payload),
+    ),
+    (
+        "borrowings-delete",
+        "delete",
+        "admin",
+        lambda t: reverse(
+            "borrowing:borrowing-detail", args=[t.spare_borrowings.pop()]
+        ),
+        None,
+    ),
+    (
+        "borrowings-return",
+        "patch",
+        "user",
+        lambda t: reverse(
+            "borrowing:borrowing-return-borrowing",
+            args=[t.paid_borrowings.pop()],
+        ),
+        None,
+    ),
+    (
+        "payments-list-user",
+        "get",
+        "user",
+        lambda t: reverse("payment:payment-list"),
+        None,
+    ),
+    (
+        "payments-list-admin",
+        "get",
+        "admin",
+        lambda t: reverse("payment:payment-list"),
+        None,
+    ),
+    (
+        "payments-detail-admin",
+        "get",
+        "admin",
+        lambda t: reverse("payment:payment-detail", args=[t.payment.id]),
+        None,
+    ),
+    (
+        "payments-outstanding",
+        "get",
+        "admin",
+        lambda t: reverse("payment:payment-outstanding"),
+        None,
+    ),
+    (
+        "payments-success",
+        "get",
+        "user",
+        lambda t: reverse("payment:payment-success", args=[t.borrowing.id]),
+        None,
+    ),
+    (
+        "payments-cancel",
+        "get",
+        "user",
+        lambda t: reverse("payment:payment-cancel", args=[t.borrowing.id]),
+        None,
+    ),
+    (
+        "payments-webhook",
+        "post",
+        None,
+        lambda t: reverse("payment:stripe-webhook"),
+        stripe_event,
+    ),
+    ("user-me", "get", "user", lambda t: reverse("user:manage"), None),
+    (
+        "user-me-update",
+        "patch",
+        "user",
+        lambda t: reverse("user:manage"),
+        json_body(lambda t, n: {"telegram_notifications_enabled": True}),
+    ),
+    (
+        "user-register",
+        "post",
+        None,
+        lambda t: reverse("user:create"),
+        json_body(
+            lambda t, n: {"email": f"new{n}@bench.com", "password": PASSWORD}
+        ),
+    ),
+    (
+        "user-token",
+        "post",
+        None,
+        lambda t: reverse("user:token_obtain_pair"),
+        json_body(
+            lambda t, n: {"email": t.user.email, "password": PASSWORD}
+        ),
+    ),
+    (
+        "user-token-refresh",
+        "post",
+        None,
+        lambda t: reverse("user:token_refresh"),
+        json_body(lambda t, n: {"refresh": t.refresh_token}),
+    ),
+    (
+        "user-token-verify",
+        "post",
+        None,
+        lambda t: reverse("user:token_verify"),
+        json_body(lambda t, n: {"token": t.refresh_token}),
+    ),
+)
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[math.ceil(percent / 100 * len(ordered)) - 1]
+
+
+# Password hashing is slow on purpose and would dominate the auth
+# endpoints, so the suite measures them with a cheap hasher.
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET,
+)
+class EndpointBudgetTests(TestCase):
+    """
+    Runs every endpoint against a seeded dataset and compares the worst
+    query count of each with its budget in baseline.json. The p95
+    latency budgets depend on the machine and are only checked with
+    BENCHMARK_TIMINGS=1.
+
+    BENCHMARK_SCALE multiplies the dataset, BENCHMARK_ITERATIONS sets the
+    number of measured requests per endpoint and
+    BENCHMARK_UPDATE_BASELINE=1 rewrites baseline.json from this run.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        users = seed_dataset(SCALE)
+        cls.user = users[0]
+        cls.admin = get_user_model().objects.create_user(
+            "admin@bench.com", PASSWORD, is_staff=True
+        )
+        cls.book = Book.objects.first()
+        cls.borrowing = Borrowing.objects.filter(user=cls.user).first()
+        cls.payment = Payment.objects.filter(
+            borrowing=cls.borrowing, type="PAYMENT"
+        ).get()
+        cls.refresh_token = str(RefreshToken.for_user(cls.user))
+
+        # objects the write endpoints use up, one per request
+        requests = ITERATIONS + 1
+        cls.readers = [
+            get_user_model().objects.create_user(f"reader{number}@bench.com")
+            for number in range(requests)
+        ]
+        cls.spare_books = [
+            Book.objects.create(
+                title=f"Spare book {number}",
+                author="Benchmark author",
+                cover="S",
+                inventory=1,
+                daily=1,
+            ).id
+            for number in range(requests)
+        ]
+        cls.spare_borrowings = [
+            cls.create_borrowing(cls.user).id for _ in range(requests)
+        ]
+        cls.paid_borrowings = []
+        for _ in range(requests):
+            borrowing = cls.create_borrowing(cls.user)
+            Payment.objects.create(
+                status="PAID",
+                type="PAYMENT",
+                borrowing=borrowing,
+                user=cls.user,
+                money_to_pay=3,
+            )
+            cls.paid_borrowings.append(borrowing.id)
+
+    @classmethod
+    def create_borrowing(cls, user):
+        return Borrowing.objects.create(
+            book=cls.book,
+            user=user,
+            expected_return_date=timezone.localdate() + timedelta(days=3),
+        )
+
+    @property
+    def reader(self):
+        """A user without payments, creating a borrowing needs one"""
+        return self.readers.pop()
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(directory.name, "media"),
+            BOOK_IMAGE_UPLOAD_DIR=os.path.join(directory.name, "uploads"),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # the webhook would hand the payments to a Celery worker
+        patcher = mock.patch("payment.views.confirm_payment")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def measure(self, method, role, url, request):
+        client = APIClient()
+
+        def prepare(number):
+            client.force_authenticate(getattr(self, role) if role else None)
+            return url(self), request(self, number) if request else {}
+
+        def send(path, arguments):
+            response = getattr(client, method)(path, **arguments)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            self.assertLess(
+                response.status_code, 400, getattr(response, "data", None)
+            )
+
+        send(*prepare(0))
+
+        timings = []
+        queries = 0
+        for number in range(1, ITERATIONS + 1):
+            path, arguments = prepare(number)
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                send(path, arguments)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(context.captured_queries))
+
+        return {
+            "queries": queries,
+            "p95_ms": round(percentile(timings, 95), 1),
+        }
+
+    def test_endpoints_within_budget(self):
+        baseline = json.loads(BASELINE_PATH.read_text())
+        measured = {}
+
+        for name, method, role, url, request in ENDPOINTS:
+            with self.subTest(endpoint=name):
+                result = self.measure(method, role, url, request)
+                measured[name] = result
+
+                if UPDATE_BASELINE:
+                    continue
+
+                self.assertIn(name, baseline, "No budget for endpoint")
+                budget = baseline[name]
+                self.assertLessEqual(
+                    result["queries"],
+                    budget["queries"],
+                    f"{name} ran {result['queries']} queries",
+                )
+                if TIMINGS:
+                    self.assertLessEqual(
+                        result["p95_ms"],
+                        budget["p95_ms"],
+                        f"{name} p95 latency is {result['p95_ms']} ms",
+                    )
+
+        if UPDATE_BASELINE:
+            # latency budgets keep headroom for slower machines
+            BASELINE_PATH.write_text(
+                json.dumps(
+                    {
+                        name: {
+                            "queries": result["queries"],
+                            "p95_ms": max(
+                                100, math.ceil(result["p95_ms"] * 4 / 10) * 10
+                            ),
+                        }
+                        for name, result in measured.items()
+                    },
+                    indent=2,
+                )
+                + "\n"
+            )
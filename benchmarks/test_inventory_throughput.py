@@ -0,0 +1,79 @@
+import os
+import time
+from unittest import skipUnless
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from benchmarks import TIMINGS, logger
+from library.inventory import return_book, take_book
+from library.models import Book
+from library_config.testing import TestCase
+
+CYCLES = int(os.getenv("BENCHMARK_INVENTORY_CYCLES", 200))
+
+
+def full_save_cycle(book):
+    book.inventory -= 1
+    book.save()
+    book.inventory += 1
+    book.save()
+
+
+def counter_save_cycle(book):
+    book.inventory -= 1
+    book.save(update_fields=["inventory"])
+    book.inventory += 1
+    book.save(update_fields=["inventory"])
+
+
+def atomic_update_cycle(book):
+    take_book(book)
+    return_book(book)
+
+
+class InventoryThroughputTests(TestCase):
+    """
+    Borrow/return cycles of one book through the old full save, the
+    inventory-only save and the atomic inventory service. The cycles per
+    second are measured with BENCHMARK_TIMINGS=1 and
+    BENCHMARK_INVENTORY_CYCLES sets the number of cycles per strategy.
+    """
+
+    def setUp(self):
+        self.book = Book.objects.create(
+            title="Benchmark book",
+            author="Benchmark author",
+            cover="H",
+            inventory=10,
+            daily=1,
+        )
+
+    def measure(self, cycle):
+        cycle(self.book)
+
+        started = time.perf_counter()
+        for _ in range(CYCLES):
+            cycle(self.book)
+        return CYCLES / (time.perf_counter() - started)
+
+    def test_counter_save_updates_only_inventory(self):
+        with CaptureQueriesContext(connection) as context:
+            counter_save_cycle(self.book)
+
+        for query in context.captured_queries:
+            self.assertNotIn('"title"', query["sql"])
+
+    @skipUnless(TIMINGS, "BENCHMARK_TIMINGS is not set")
+    def test_inventory_throughput(self):
+        full_save = self.measure(full_save_cycle)
+        counter_save = self.measure(counter_save_cycle)
+        atomic_update = self.measure(atomic_update_cycle)
+
+        logger.info(
+            "Borrow/return cycles per second: full save %.0f, "
+            "inventory-only save %.0f, atomic update %.0f",
+            full_save,
+            counter_save,
+            atomic_update,
+        )
@@ -2,12 +2,65 @@ from datetime import timedelta
 
 from django.conf import settings
 from django.db import models
+from django.db.models import (
+    BooleanField,
+    Count,
+    DateField,
+    ExpressionWrapper,
+    Func,
+    IntegerField,
+    Q,
+    Value,
+)
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
 from library.models import Book
 
 
+class DateDiff(Func):
+    """Whole days between two dates (date - date is an integer in Postgres)"""
+
+    arg_joiner = " - "
+    template = "(%(expressions)s)"
+    output_field = IntegerField()
+
+
+class BorrowingQuerySet(models.QuerySet):
+    def with_metrics(self):
+        """
+        Annotates days_from_borrow and is_active in SQL, so they can be
+        used in filter() and order_by() like regular columns.
+        """
+        today = timezone.now().date()
+        return self.annotate(
+            days_from_borrow=DateDiff(
+                Coalesce(
+                    "actual_return_date",
+                    Value(today, output_field=DateField()),
+                ),
+                "borrow_date",
+            ),
+            is_active=ExpressionWrapper(
+                Q(actual_return_date__isnull=True),
+                output_field=BooleanField(),
+            ),
+        )
+
+    def counts(self):
+        """Total, active and overdue borrowings in one aggregate query"""
+        today = timezone.now().date()
+        active = Q(actual_return_date__isnull=True)
+        return self.aggregate(
+            total=Count("id"),
+            active=Count("id", filter=active),
+            overdue=Count(
+                "id", filter=active & Q(expected_return_date__lt=today)
+            ),
+        )
+
+
 class Borrowing(models.Model):
     borrow_date = models.DateField(auto_now_add=True)
     expected_return_date = models.DateField()
@@ -15,26 +68,65 @@ class Borrowing(models.Model):
     book = models.ForeignKey(
         Book, on_delete=models.CASCADE, related_name="borrowings"
     )
+    # indexed as the first column of borrowing_user_returned_idx
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name="borrowings",
+        db_index=False,
     )
 
+    objects = BorrowingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # key of the cursor pagination of the borrowing list
+            models.Index(
+                fields=["borrow_date", "id"],
+                name="borrowing_borrow_date_id_idx",
+            ),
+            # borrowings of a user, optionally only the active ones
+            models.Index(
+                fields=["user", "actual_return_date"],
+                name="borrowing_user_returned_idx",
+            ),
+            # the overdue sweep walks active borrowings in id order and
+            # checks expected_return_date without reading the table
+            models.Index(
+                fields=["id"],
+                include=["expected_return_date"],
+                name="borrowing_active_due_idx",
+                condition=Q(actual_return_date__isnull=True),
+            ),
+        ]
+
     @property
     def days_from_borrow(self):
+        if hasattr(self, "_days_from_borrow"):
+            return self._days_from_borrow
         if self.actual_return_date is not None:
             date = self.actual_return_date - self.borrow_date
             return date.days
         date = timezone.now().date() - self.borrow_date
         return date.days
 
+    @days_from_borrow.setter
+    def days_from_borrow(self, value):
+        # set by BorrowingQuerySet.with_metrics()
+        self._days_from_borrow = value
+
     @property
     def is_active(self):
+        if hasattr(self, "_is_active"):
+            return self._is_active
         if self.actual_return_date is None:
             return True
         return False
 
+    @is_active.setter
+    def is_active(self, value):
+        self._is_active = value
+
     @staticmethod
     def validate_book_return_time(expected_date, book, error_to_raise):
         today = timezone.now().date()
@@ -0,0 +1,88 @@
+import time
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+from django.utils import timezone
+
+from borrowing.models import Borrowing
+
+
+@dataclass
+class SweepStats:
+    scanned: int = 0
+    notified: int = 0
+    elapsed: float = 0.0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def overdue_borrowings(today=None):
+    """Active borrowings whose expected return date has already passed"""
+    today = today or timezone.localdate()
+    return Borrowing.objects.filter(
+        actual_return_date__isnull=True,
+        expected_return_date__lt=today,
+    )
+
+
+def iter_overdue_chunks(queryset, chunk_size):
+    """
+    Walks the queryset in primary key order, one bounded chunk at a time.
+    Each chunk continues from the last seen id (keyset pagination), so a
+    chunk deep into the table costs the same as the first one.
+    """
+    queryset = queryset.select_related("user", "book").order_by("id")
+    last_id = 0
+    while True:
+        chunk = list(
+            queryset.filter(id__gt=last_id)[:chunk_size].iterator(
+                chunk_size=chunk_size
+            )
+        )
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def iter_overdue_shards(queryset, shard_size):
+    """
+    Splits the queryset into (first_id, last_id) ranges of at most
+    shard_size rows each. Only ids are streamed from the database.
+    """
+    ids = queryset.order_by("id").values_list("id", flat=True)
+    first_id = last_id = None
+    count = 0
+    for borrowing_id in ids.iterator(chunk_size=shard_size):
+        if first_id is None:
+            first_id = borrowing_id
+        last_id = borrowing_id
+        count += 1
+        if count == shard_size:
+            yield first_id, last_id
+            first_id, count = None, 0
+    if first_id is not None:
+        yield first_id, last_id
+
+
+def sweep_overdue(notify, queryset=None, chunk_size=None):
+    """
+    Calls notify(borrowing) for every overdue borrowing and collects
+    per-run stats. notify should return True if the user was notified.
+    """
+    started = time.monotonic()
+    stats = SweepStats()
+
+    if queryset is None:
+        queryset = overdue_borrowings()
+    chunk_size = chunk_size or settings.OVERDUE_SWEEP_CHUNK_SIZE
+
+    for chunk in iter_overdue_chunks(queryset, chunk_size):
+        for borrowing in chunk:
+            stats.scanned += 1
+            if notify(borrowing):
+                stats.notified += 1
+
+    stats.elapsed = round(time.monotonic() - started, 3)
+    return stats
@@ -0,0 +1,208 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor,
+    CursorPagination,
+    PageNumberPagination,
+)
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination that remembers the values of every ordering field
+    of the last row, so the next page is a `WHERE (a, b) > (x, y)` range
+    scan over the ordering index instead of an OFFSET. `id` is always
+    added as the last ordering field to keep the key unique.
+
+    Passing `?page=` switches to the legacy page-number pagination for
+    clients that still need page numbers and a total count.
+    """
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = "-id"
+    legacy_pagination_class = PageNumberPagination
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+        if not {"id", "-id", "pk", "-pk"} & set(ordering):
+            ordering.append("-id" if ordering[0].startswith("-") else "id")
+        return tuple(ordering)
+
+    def get_legacy_paginator(self):
+        paginator = self.legacy_pagination_class()
+        paginator.page_size = self.page_size
+        paginator.page_size_query_param = self.page_size_query_param
+        paginator.max_page_size = self.max_page_size
+        return paginator
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = (getattr(instance, field.lstrip("-")) for field in ordering)
+        return json.dumps(
+            [None if value is None else str(value) for value in values]
+        )
+
+    @staticmethod
+    def _get_field_filters(name, lookup, value):
+        """
+        The (beyond, equal) filters of one field. PostgreSQL sorts NULL
+        after every value in ascending order and before them in
+        descending order, so NULL counts as the greatest value
+        """
+        if value is None:
+            if lookup == "gt":
+                return Q(pk__in=[]), Q(**{f"{name}__isnull": True})
+            return (
+                Q(**{f"{name}__isnull": False}),
+                Q(**{f"{name}__isnull": True}),
+            )
+        beyond = Q(**{f"{name}__{lookup}": value})
+        if lookup == "gt":
+            beyond |= Q(**{f"{name}__isnull": True})
+        return beyond, Q(**{name: value})
+
+    def _get_position_filter(self, ordering, position, reverse):
+        """
+        Builds `(a > x) OR (a = x AND b > y) OR ...` with the comparison
+        flipped for descending fields and for backward cursors
+        """
+        try:
+            values = json.loads(position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        if not all(isinstance(value, (str, type(None))) for value in values):
+            raise NotFound(self.invalid_cursor_message)
+
+        position_filter = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") != reverse else "gt"
+            beyond, same = self._get_field_filters(name, lookup, value)
+            position_filter |= equal & beyond
+            equal &= same
+        return position_filter
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.legacy_paginator = None
+        if self.legacy_pagination_class.page_query_param in (
+            request.query_params
+        ):
+            self.legacy_paginator = self.get_legacy_paginator()
+            page = self.legacy_paginator.paginate_queryset(
+                queryset.order_by(*self.ordering), request, view
+            )
+            self.display_page_controls = (
+                self.legacy_paginator.display_page_controls
+            )
+            return page
+
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (reverse, current_position) = (False, None)
+        else:
+            (_, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(
+                *(
+                    field[1:] if field.startswith("-") else f"-{field}"
+                    for field in self.ordering
+                )
+            )
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            try:
+                queryset = queryset.filter(
+                    self._get_position_filter(
+                        self.ordering, current_position, reverse
+                    )
+                )
+            except (TypeError, ValueError, ValidationError):
+                # a tampered cursor with values the fields can't hold
+                raise NotFound(self.invalid_cursor_message)
+
+        # one extra row tells if there are more rows in this direction
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > len(self.page)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = current_position is not None
+
+        self.next_position = self.previous_position = current_position
+        if self.page:
+            self.next_position = self._get_position_from_instance(
+                self.page[-1], self.ordering
+            )
+            self.previous_position = self._get_position_from_instance(
+                self.page[0], self.ordering
+            )
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.next_position)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.previous_position)
+        )
+
+    def get_paginated_response(self, data):
+        if self.legacy_paginator is not None:
+            return self.legacy_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.legacy_paginator is not None:
+            return self.legacy_paginator.get_html_context()
+        return super().get_html_context()
+
+    def to_html(self):
+        if self.legacy_paginator is not None:
+            return self.legacy_paginator.to_html()
+        return super().to_html()
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.append(
+            {
+                "name": self.legacy_pagination_class.page_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Page number, switches the list to the "
+                "legacy page-number pagination with a total count",
+                "schema": {"type": "integer"},
+            }
+        )
+        return parameters
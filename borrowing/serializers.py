@@ -7,10 +7,11 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from borrowing.models import Borrowing
+from library.inventory import return_book
 from library.serializers import BookSerializer
 from payment.models import Payment
 from payment.serializers import PaymentSerializer
-from payment.stripe_helper import create_stripe_session
+from payment.checkout import start_checkout
 from user.serializers import UserSerializer
 
 
@@ -37,11 +38,8 @@ class BorrowingSerializer(serializers.ModelSerializer):
     @transaction.atomic()
     def create(self, validated_data):
         borrowing = Borrowing.objects.create(**validated_data)
-        book = validated_data["book"]
-        book.save()
 
-        request = self.context.get("request")
-        create_stripe_session(borrowing, request)
+        start_checkout(borrowing, self.context.get("request"))
         return borrowing
 
     @transaction.atomic()
@@ -55,9 +53,8 @@ class BorrowingSerializer(serializers.ModelSerializer):
         )
         book = validated_data["book"]
         if instance.actual_return_date and returned is None:
-            book.inventory += 1
+            return_book(book)
         instance.save()
-        book.save()
 
         return instance
 
@@ -146,6 +143,20 @@ class BorrowingAdminDetailSerializer(BorrowingDetailSerializer):
         )
 
 
+class BookBorrowingSerializer(serializers.ModelSerializer):
+    user = serializers.CharField(source="user.email", read_only=True)
+
+    class Meta:
+        model = Borrowing
+        fields = (
+            "id",
+            "user",
+            "borrow_date",
+            "expected_return_date",
+            "actual_return_date",
+        )
+
+
 class BorrowingCreateSerializer(BorrowingSerializer):
     message = serializers.CharField(
         max_length=63,
@@ -213,7 +224,8 @@ class BorrowingReturnSerializer(serializers.ModelSerializer):
                 "The borrowed book has already been returned."
             )
         payment = Payment.objects.filter(borrowing=borrowing).first()
-        if payment.status == "PENDING" and borrowing.actual_return_date is None:
+        # the book is taken only once the first payment is paid
+        if payment.status != "PAID" and borrowing.actual_return_date is None:
             raise serializers.ValidationError("You can't return book before you get it")
 
         return attrs
@@ -221,13 +233,12 @@ class BorrowingReturnSerializer(serializers.ModelSerializer):
     @transaction.atomic
     def update(self, instance, validated_data):
         instance.actual_return_date = datetime.date.today()
-        instance.book.inventory += 1
-        instance.book.save()
+        return_book(instance.book)
         instance.save()
 
         request = self.context.get("request")
         if not (timezone.now().date() - instance.expected_return_date).days <= 0:
-            create_stripe_session(instance, request)
+            start_checkout(instance, request)
 
         return instance
 
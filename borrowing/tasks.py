@@ -1,74 +1,167 @@
-import datetime
-import os
-import requests
-from borrowing.models import Borrowing
-from celery import shared_task
-from django.utils import timezone
-from payment.stripe_helper import FINE_MULTIPLIER
+import heapq
+from decimal import Decimal
+from urllib.parse import urljoin
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.urls import reverse
+
+from borrowing.overdue_sweep import (
+    iter_overdue_shards,
+    overdue_borrowings,
+    sweep_overdue,
+)
+from notifications.telegram_client import (
+    ADMIN_GROUP,
+    TelegramMessage,
+    deliver,
+)
+from payment.pricing import overdue_days, with_prices
 
 
 OVERDUE_IMAGE_URL = "https://i.imgur.com/258kR4X.jpg"
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def get_overdue_message(borrowing):
+    if not (
+        borrowing.user.telegram_notifications_enabled
+        and borrowing.user.telegram_id
+    ):
+        return None
+
+    return TelegramMessage(
+        borrowing.user.telegram_id,
+        f"📕 You have an outdated borrowing: "
+        f"{borrowing.book.title} for {overdue_days(borrowing)}"
+        f" days. 💰You have to pay additional "
+        f"{borrowing.fine_price}$, please return the book",
+        OVERDUE_IMAGE_URL,
+    )
+
+
+def get_digest_line(borrowing):
+    return (
+        f"📕 {borrowing.user.email}: {borrowing.book.title}, "
+        f"{overdue_days(borrowing)} days, "
+        f"{borrowing.fine_price}$💰"
+    )
 
 
-def get_fine_price(borrowing):
-    overdue_days = (
-        timezone.localdate()
-        - borrowing.expected_return_date
-    ).days
+def split_digest(header, lines):
+    messages = []
+    current = header
+    for line in lines:
+        if len(current) + len(line) + 1 > TELEGRAM_MESSAGE_LIMIT:
+            messages.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}"
+    messages.append(current)
+    return messages
+
+
+def worst_offenders(entries):
+    """The OVERDUE_DIGEST_SIZE (fine, line) entries with the biggest fines"""
+    return heapq.nlargest(
+        settings.OVERDUE_DIGEST_SIZE,
+        entries,
+        key=lambda entry: Decimal(entry[0]),
+    )
+
+
+@shared_task
+def send_overdue_shard(first_id, last_id):
+    """
+    Notifies the users of one shard. Only counts, the total of the fines
+    and the worst offenders go back to overdue_summary, so the result
+    doesn't grow with the number of overdue borrowings
+    """
+    fines = []
+    messages = []
+
+    def collect(borrowing):
+        fines.append((str(borrowing.fine_price), get_digest_line(borrowing)))
+        message = get_overdue_message(borrowing)
+        if message is None:
+            return False
+        messages.append(message)
+        return True
 
-    fine_price_in_cents = int(
-        overdue_days
-        * float(borrowing.book.daily)
-        * FINE_MULTIPLIER
-        * 100
-    ) if overdue_days > 0 else 0
+    # the fines are computed by the query that loads the chunks
+    queryset = with_prices(
+        overdue_borrowings().filter(id__gte=first_id, id__lte=last_id)
+    )
+    stats = sweep_overdue(collect, queryset=queryset)
+    stats.notified = sum(deliver(messages))
 
-    return fine_price_in_cents / 100
+    return {
+        **stats.as_dict(),
+        "fines": str(sum((Decimal(fine) for fine, _ in fines), Decimal())),
+        "worst": worst_offenders(fines),
+    }
+
+
+@shared_task
+def overdue_summary(results):
+    """
+    Posts one digest of a bounded size to the admin group: the totals,
+    the worst offenders and a link to the full outstanding payments
+    """
+    scanned = sum(result["scanned"] for result in results)
+    notified = sum(result["notified"] for result in results)
+
+    if not scanned:
+        digest = ["Nobody has overdue borrowings today"]
+    else:
+        fines = sum(
+            (Decimal(result["fines"]) for result in results), Decimal()
+        )
+        worst = worst_offenders(
+            entry for result in results for entry in result["worst"]
+        )
+        header = (
+            f"📕 Overdue borrowings today: {scanned}, "
+            f"users notified: {notified}, fines: {fines}$💰\n"
+            f"The biggest {len(worst)} fines:"
+        )
+        outstanding_url = urljoin(
+            settings.CHECKOUT_BASE_URL,
+            reverse("payment:payment-outstanding"),
+        )
+        digest = split_digest(
+            header,
+            [line for _, line in worst]
+            + [f"All outstanding payments: {outstanding_url}"],
+        )
+
+    if ADMIN_GROUP:
+        deliver(TelegramMessage(ADMIN_GROUP, text) for text in digest)
+
+    return {
+        "shards": len(results),
+        "scanned": scanned,
+        "notified": notified,
+        "elapsed": max(
+            (result["elapsed"] for result in results), default=0.0
+        ),
+    }
 
 
 @shared_task
 def borrowing_books():
-    borrowings = Borrowing.objects.all()
-    nobody_borrowed = True
-    for borrowing in borrowings:
-        if borrowing.expected_return_date < timezone.localdate():
-            additional_price = get_fine_price(borrowing)
-            overdued_days = (
-                datetime.date.today().day - borrowing.days_from_borrow
-            )
-
-            if (
-                borrowing.user.telegram_notifications_enabled
-                and borrowing.user.telegram_id
-            ):
-                url_for_user = (
-                    f"https://api.telegram.org/bot{os.getenv('BOT_TOKEN')}"
-                    f"/sendPhoto?chat_id={borrowing.user.telegram_id}"
-                    f"&photo={OVERDUE_IMAGE_URL}"
-                    f"&caption=📕 You have an outdated borrowing: "
-                    f"{borrowing.book.title} for {overdued_days}"
-                    f" days. 💰You have to pay additional "
-                    f"{additional_price}$, please return the book"
-                )
-                requests.get(url_for_user)
-
-            url_for_admin_group = (
-                f"https://api.telegram.org/bot{os.getenv('BOT_TOKEN')}"
-                f"/sendPhoto?chat_id={os.getenv('ADMIN_GROUP')}"
-                f"&photo={OVERDUE_IMAGE_URL}"
-                f"&caption=📕 User {borrowing.user.email} "
-                f"has borrowing overdue for book: {borrowing.book.title} "
-                f"for {overdued_days}"
-                f" days. He has to pay additional {additional_price}$💰"
-            )
-            requests.get(url_for_admin_group)
-            nobody_borrowed = False
-    if nobody_borrowed:
-        url_for_admin_group = (
-            f"https://api.telegram.org/bot{os.getenv('BOT_TOKEN')}"
-            f"/sendMessage?chat_id={os.getenv('ADMIN_GROUP')}"
-            f"&text=Nobody has overdue borrowings today"
+    shards = list(
+        iter_overdue_shards(
+            overdue_borrowings(), settings.OVERDUE_SHARD_SIZE
         )
-        requests.get(url_for_admin_group)
+    )
+
+    if not shards:
+        overdue_summary.delay([])
+    else:
+        chord(
+            send_overdue_shard.s(first_id, last_id)
+            for first_id, last_id in shards
+        )(overdue_summary.s())
 
-    return "Sent borrowing notifications"
+    return {"shards": len(shards)}
@@ -1,7 +1,6 @@
 from datetime import timedelta
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
 from django.urls import reverse
 from django.utils import timezone
 
@@ -16,6 +15,7 @@ from borrowing.serializers import (
     BorrowingAdminDetailSerializer,
 )
 from library.models import Book
+from library_config.testing import TestCase
 from payment.models import Payment
 
 BORROWING_URL = reverse("borrowing:borrowing-list")
@@ -151,6 +151,50 @@ class AuthenticatedBorrowingApiTests(TestCase):
         self.assertIn(serializer3.data, response.data["results"])
         self.assertNotIn(serializer2.data, response.data["results"])
 
+    def test_filter_borrowing_by_is_active_false(self):
+        borrowing1 = sample_borrowing(user=self.user)
+        borrowing2 = sample_borrowing(
+            actual_return_date=timezone.now().date(),
+            user=self.user
+        )
+
+        response = self.client.get(
+            BORROWING_URL, {"is_active": "False"}
+        )
+
+        ids = [borrowing["id"] for borrowing in response.data["results"]]
+        self.assertEqual(ids, [borrowing2.id])
+        self.assertNotIn(borrowing1.id, ids)
+
+    def test_order_and_filter_borrowings_by_days_from_borrow(self):
+        today = timezone.now().date()
+        borrowings = []
+        for days in (3, 12, 20):
+            borrowing = sample_borrowing(user=self.user)
+            Borrowing.objects.filter(id=borrowing.id).update(
+                borrow_date=today - timedelta(days=days)
+            )
+            borrowings.append(borrowing)
+
+        response = self.client.get(
+            BORROWING_URL, {"ordering": "-days_from_borrow", "min_days": 10}
+        )
+
+        results = response.data["results"]
+        self.assertEqual(
+            [borrowing["id"] for borrowing in results],
+            [borrowings[2].id, borrowings[1].id],
+        )
+        self.assertEqual(
+            [borrowing["days_from_borrow"] for borrowing in results],
+            [20, 12],
+        )
+
+    def test_filter_borrowing_by_invalid_min_days(self):
+        response = self.client.get(BORROWING_URL, {"min_days": "ten"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_filter_borrowing_by_user_id_not_working(self):
         user = get_user_model().objects.create_user(
             "user@test.com",
@@ -0,0 +1,204 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.pagination import Cursor
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from borrowing.models import Borrowing
+from borrowing.pagination import KeysetCursorPagination
+from library.models import Book
+from library_config.testing import TestCase
+from payment.models import Payment
+
+BORROWING_URL = reverse("borrowing:borrowing-list")
+PAGE_SIZES = (1, 5, 20)
+
+
+def detail_url(borrowing_id):
+    return reverse("borrowing:borrowing-detail", args=[borrowing_id])
+
+
+class BorrowingQueryCountTests(TestCase):
+    """
+    Every page must cost the same number of queries no matter how many
+    borrowings (and nested payments) it renders.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_user(
+            "admin@admin.com", "testpass", is_staff=True
+        )
+        self.user = get_user_model().objects.create_user(
+            "test@test.com", "testpass"
+        )
+        book = Book.objects.create(
+            title="Sample book",
+            author="Steven King",
+            cover="H",
+            inventory=5,
+            daily=3,
+        )
+        for number in range(max(PAGE_SIZES)):
+            borrowing = Borrowing.objects.create(
+                expected_return_date=(
+                    timezone.now().date() + timedelta(days=2)
+                ),
+                book=book,
+                user=self.user,
+            )
+            for payment_type in ("PAYMENT", "FINE"):
+                Payment.objects.create(
+                    status="PAID",
+                    type=payment_type,
+                    borrowing=borrowing,
+                    session_id=f"cs_{number}_{payment_type}",
+                    session_url="https://checkout.stripe.com/pay",
+                    user=self.user,
+                )
+        self.borrowing = borrowing
+
+    def assert_list_queries(self, user, expected_queries):
+        self.client.force_authenticate(user)
+        for page_size in PAGE_SIZES:
+            with self.subTest(page_size=page_size):
+                with self.assertNumQueries(expected_queries):
+                    response = self.client.get(
+                        BORROWING_URL, {"page_size": page_size}
+                    )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(response.data["results"]), page_size)
+
+    def test_user_list_query_count(self):
+        # cursor pagination runs no count query
+        self.assert_list_queries(self.user, 1)
+
+    def test_admin_list_query_count(self):
+        # page + payments of the page
+        self.assert_list_queries(self.admin, 2)
+
+    def test_legacy_page_number_query_count(self):
+        self.client.force_authenticate(self.user)
+
+        # count + page
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                BORROWING_URL, {"page": 2, "page_size": 5}
+            )
+
+        self.assertEqual(response.data["count"], max(PAGE_SIZES))
+        self.assertEqual(len(response.data["results"]), 5)
+
+    def test_cursor_pages_cover_every_borrowing_once(self):
+        self.client.force_authenticate(self.user)
+        expected_ids = list(
+            Borrowing.objects.order_by("-borrow_date", "-id").values_list(
+                "id", flat=True
+            )
+        )
+
+        ids = []
+        url = f"{BORROWING_URL}?page_size=3"
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            ids.extend(
+                borrowing["id"] for borrowing in response.data["results"]
+            )
+            url = response.data["next"]
+        self.assertEqual(ids, expected_ids)
+
+        response = self.client.get(response.data["previous"])
+        self.assertEqual(
+            [borrowing["id"] for borrowing in response.data["results"]],
+            expected_ids[-5:-2],
+        )
+
+    def test_tampered_cursor_is_not_found(self):
+        self.client.force_authenticate(self.user)
+        paginator = KeysetCursorPagination()
+        paginator.base_url = f"http://testserver{BORROWING_URL}"
+
+        for position in ('["abc", "x"]', '["2024-01-01", [1]]'):
+            url = paginator.encode_cursor(
+                Cursor(offset=0, reverse=False, position=position)
+            )
+            response = self.client.get(url)
+
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_pages_walk_over_null_values(self):
+        ids = Borrowing.objects.order_by("id").values_list("id", flat=True)
+        Borrowing.objects.filter(id__in=list(ids)[::3]).update(
+            actual_return_date=timezone.localdate()
+        )
+        factory = APIRequestFactory()
+
+        for ordering in ("actual_return_date", "-actual_return_date"):
+            paginator = KeysetCursorPagination()
+            paginator.ordering = ordering
+            paginator.page_size = 3
+            expected_ids = list(
+                Borrowing.objects.order_by(
+                    *paginator.get_ordering(None, None, None)
+                ).values_list("id", flat=True)
+            )
+
+            def walk(url, next_link):
+                walked = []
+                while url:
+                    page = paginator.paginate_queryset(
+                        Borrowing.objects.all(), Request(factory.get(url))
+                    )
+                    walked.append([borrowing.id for borrowing in page])
+                    url = next_link()
+                return walked
+
+            pages = walk(BORROWING_URL, paginator.get_next_link)
+            self.assertEqual(sum(pages, []), expected_ids)
+
+            # back from the last row, every row before it once
+            last_url = paginator.encode_cursor(
+                Cursor(
+                    offset=0,
+                    reverse=True,
+                    position=paginator.next_position,
+                )
+            )
+            pages = walk(last_url, paginator.get_previous_link)
+            self.assertEqual(sum(pages[::-1], []), expected_ids[:-1])
+
+    def test_admin_list_renders_prefetched_payments(self):
+        self.client.force_authenticate(self.admin)
+
+        response = self.client.get(BORROWING_URL, {"page_size": 1})
+        payments = response.data["results"][0]["payments"]
+
+        self.assertEqual(len(payments), 2)
+        for payment in payments:
+            self.assertEqual(set(payment), {"id", "status"})
+
+    def test_admin_retrieve_query_count(self):
+        self.client.force_authenticate(self.admin)
+
+        # borrowing with book and user + its payments
+        with self.assertNumQueries(2):
+            response = self.client.get(detail_url(self.borrowing.id))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["payments"]), 2)
+        self.assertEqual(response.data["user"]["email"], self.user.email)
+
+    def test_user_retrieve_query_count(self):
+        self.client.force_authenticate(self.user)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(detail_url(self.borrowing.id))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["book"]["title"], "Sample book")
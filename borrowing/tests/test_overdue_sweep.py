@@ -0,0 +1,190 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from borrowing.models import Borrowing
+from borrowing.overdue_sweep import (
+    iter_overdue_shards,
+    overdue_borrowings,
+    sweep_overdue,
+)
+from borrowing.tasks import (
+    borrowing_books,
+    overdue_summary,
+    send_overdue_shard,
+)
+from library.models import Book
+from library_config.celery import app as celery_app
+from library_config.testing import TestCase
+
+TODAY = timezone.localdate()
+ADMIN_GROUP = -100
+
+
+def sample_book(**params):
+    defaults = {
+        "title": "Sample book",
+        "author": "Steven King",
+        "cover": "H",
+        "inventory": 5,
+        "daily": 3,
+    }
+    defaults.update(params)
+
+    return Book.objects.create(**defaults)
+
+
+def sample_borrowing(user, **params):
+    defaults = {
+        "expected_return_date": TODAY - timedelta(days=2),
+        "book": sample_book(),
+        "user": user,
+    }
+    defaults.update(params)
+
+    return Borrowing.objects.create(**defaults)
+
+
+class OverdueSweepTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "test@test.com",
+            "testpass",
+            telegram_notifications_enabled=True,
+            telegram_id=12345,
+        )
+
+        self.sent = []
+        patchers = (
+            mock.patch("borrowing.tasks.deliver", side_effect=self.deliver),
+            mock.patch("borrowing.tasks.ADMIN_GROUP", ADMIN_GROUP),
+        )
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def deliver(self, messages):
+        messages = list(messages)
+        self.sent.extend(messages)
+        return [True] * len(messages)
+
+    def run_tasks_eagerly(self):
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(
+            setattr, celery_app.conf, "task_always_eager", False
+        )
+
+    def test_only_active_overdue_borrowings_are_selected(self):
+        overdue = sample_borrowing(self.user)
+        sample_borrowing(self.user, actual_return_date=TODAY)
+        sample_borrowing(
+            self.user, expected_return_date=TODAY + timedelta(days=2)
+        )
+
+        self.assertEqual(list(overdue_borrowings()), [overdue])
+
+    def test_sweep_walks_in_chunks_without_per_row_queries(self):
+        for _ in range(5):
+            sample_borrowing(self.user)
+
+        seen = []
+
+        def notify(borrowing):
+            seen.append((borrowing.user.email, borrowing.book.title))
+            return True
+
+        # 5 rows in chunks of 2: three full or partial chunks + final probe
+        with self.assertNumQueries(4):
+            stats = sweep_overdue(notify, chunk_size=2)
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(stats.scanned, 5)
+        self.assertEqual(stats.notified, 5)
+
+    def test_shards_cover_every_overdue_borrowing_once(self):
+        ids = [sample_borrowing(self.user).id for _ in range(5)]
+
+        shards = list(iter_overdue_shards(overdue_borrowings(), 2))
+
+        self.assertEqual(
+            shards, [(ids[0], ids[1]), (ids[2], ids[3]), (ids[4], ids[4])]
+        )
+
+    def test_shard_notifies_only_its_range(self):
+        first = sample_borrowing(self.user)
+        sample_borrowing(self.user)
+
+        result = send_overdue_shard(first.id, first.id)
+
+        self.assertEqual(result["scanned"], 1)
+        self.assertEqual(result["notified"], 1)
+        self.assertEqual(len(result["worst"]), 1)
+        self.assertEqual(result["fines"], result["worst"][0][0])
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.sent[0].chat_id, self.user.telegram_id)
+
+    def test_summary_posts_single_admin_digest(self):
+        results = [
+            {
+                "scanned": 2,
+                "notified": 1,
+                "elapsed": 0.1,
+                "fines": "15.00",
+                "worst": [["12.00", "a"], ["3.00", "c"]],
+            },
+            {
+                "scanned": 1,
+                "notified": 1,
+                "elapsed": 0.2,
+                "fines": "6.00",
+                "worst": [["6.00", "b"]],
+            },
+        ]
+
+        summary = overdue_summary(results)
+
+        self.assertEqual(summary["scanned"], 3)
+        self.assertEqual(summary["notified"], 2)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.sent[0].chat_id, ADMIN_GROUP)
+        self.assertIn("fines: 21.00$", self.sent[0].text)
+        self.assertIn("a\nb\nc", self.sent[0].text)
+        self.assertIn("/api/payments/outstanding/", self.sent[0].text)
+
+    def test_shard_results_stay_bounded(self):
+        for days in range(2, 7):
+            sample_borrowing(
+                self.user, expected_return_date=TODAY - timedelta(days=days)
+            )
+
+        with self.settings(OVERDUE_DIGEST_SIZE=2):
+            result = send_overdue_shard(0, 10 ** 9)
+
+        self.assertEqual(result["scanned"], 5)
+        self.assertEqual(
+            [fine for fine, _ in result["worst"]], ["27.00", "22.50"]
+        )
+
+    def test_borrowing_books_fans_out_to_shards(self):
+        for _ in range(3):
+            sample_borrowing(self.user)
+
+        self.run_tasks_eagerly()
+        with self.settings(OVERDUE_SHARD_SIZE=2):
+            result = borrowing_books()
+
+        self.assertEqual(result["shards"], 2)
+        # one message per user plus one admin digest
+        self.assertEqual(len(self.sent), 4)
+
+    def test_borrowing_books_without_overdue(self):
+        self.run_tasks_eagerly()
+        result = borrowing_books()
+
+        self.assertEqual(result["shards"], 0)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(
+            self.sent[0].text, "Nobody has overdue borrowings today"
+        )
@@ -1,7 +1,8 @@
 from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import viewsets, serializers, status
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
@@ -12,7 +13,7 @@ from drf_spectacular.utils import (
 )
 
 from borrowing.models import Borrowing
-from notifications.bot_commands import send_borrowing_notification
+from borrowing.pagination import KeysetCursorPagination
 from payment.models import Payment
 from user.permissions import IsAdminOrIfAuthenticatedReadAndCreateOnly
 from borrowing.serializers import (
@@ -27,9 +28,32 @@ from borrowing.serializers import (
 )
 
 
-class BorrowingListPagination(PageNumberPagination):
-    page_size = 10
-    max_page_size = 100
+BORROWING_FIELDS = (
+    "id",
+    "borrow_date",
+    "expected_return_date",
+    "actual_return_date",
+    "book",
+    "user",
+)
+BORROWING_LIST_FIELDS = BORROWING_FIELDS + ("book__title",)
+BORROWING_ADMIN_LIST_FIELDS = BORROWING_LIST_FIELDS + ("user__email",)
+BORROWING_ADMIN_DETAIL_FIELDS = BORROWING_FIELDS + (
+    "user__email",
+    "user__first_name",
+    "user__last_name",
+)
+PAYMENT_LIST_FIELDS = ("id", "status", "borrowing")
+PAYMENT_DETAIL_FIELDS = PAYMENT_LIST_FIELDS + (
+    "type",
+    "session_id",
+    "session_url",
+    "money_to_pay",
+)
+
+
+class BorrowingListPagination(KeysetCursorPagination):
+    ordering = ("-borrow_date", "-id")
 
 
 class BorrowingViewSet(viewsets.ModelViewSet):
@@ -37,17 +61,88 @@ class BorrowingViewSet(viewsets.ModelViewSet):
     serializer_class = BorrowingSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadAndCreateOnly,)
     pagination_class = BorrowingListPagination
+    filter_backends = (OrderingFilter,)
+    ordering = BorrowingListPagination.ordering
+    ordering_fields = (
+        "id",
+        "borrow_date",
+        "expected_return_date",
+        "days_from_borrow",
+    )
+
+    @staticmethod
+    def _params_to_int(value, name):
+        try:
+            return int(value)
+        except ValueError:
+            raise serializers.ValidationError(
+                {name: "A valid integer is required."}
+            )
+
+    def _get_read_queryset(self, queryset):
+        """
+        Loads only the columns the list/retrieve serializers render, with
+        the nested payments of admin serializers fetched in one extra
+        query per page instead of one query per borrowing.
+        """
+        queryset = queryset.with_metrics()
+        is_staff = self.request.user.is_staff
+
+        if self.action == "list" and not is_staff:
+            return queryset.select_related("book").only(
+                *BORROWING_LIST_FIELDS
+            )
+
+        if self.action == "list":
+            return queryset.select_related("book", "user").only(
+                *BORROWING_ADMIN_LIST_FIELDS
+            ).prefetch_related(
+                Prefetch(
+                    "payments",
+                    queryset=Payment.objects.only(*PAYMENT_LIST_FIELDS),
+                )
+            )
+
+        if not is_staff:
+            return queryset.select_related("book").only(*BORROWING_FIELDS)
+
+        return queryset.select_related("book", "user").only(
+            *BORROWING_ADMIN_DETAIL_FIELDS
+        ).prefetch_related(
+            Prefetch(
+                "payments",
+                queryset=Payment.objects.only(*PAYMENT_DETAIL_FIELDS),
+            )
+        )
 
     def get_queryset(self):
         queryset = self.queryset
         is_active = self.request.query_params.get("is_active")
         user_id = self.request.query_params.get("user_id")
+        min_days = self.request.query_params.get("min_days")
+        max_days = self.request.query_params.get("max_days")
 
         if self.action in ("list", "retrieve"):
-            queryset = queryset.select_related("book", "user")
+            queryset = self._get_read_queryset(queryset)
 
         if is_active in ("True", "1"):
             queryset = queryset.filter(actual_return_date=None)
+        elif is_active in ("False", "0"):
+            queryset = queryset.filter(actual_return_date__isnull=False)
+
+        if self.action == "list" and min_days:
+            queryset = queryset.filter(
+                days_from_borrow__gte=self._params_to_int(
+                    min_days, "min_days"
+                )
+            )
+
+        if self.action == "list" and max_days:
+            queryset = queryset.filter(
+                days_from_borrow__lte=self._params_to_int(
+                    max_days, "max_days"
+                )
+            )
 
         if self.request.user.is_staff and user_id:
             queryset = queryset.filter(user_id=int(user_id))
@@ -64,7 +159,27 @@ class BorrowingViewSet(viewsets.ModelViewSet):
                 "is_active",
                 type=bool,
                 description="Filter by borrowing is active "
-                            "(ex. ?is_active=True)",
+                            "(ex. ?is_active=True or ?is_active=False)",
+            ),
+            OpenApiParameter(
+                "min_days",
+                type=int,
+                description="Filter by minimal days from borrow "
+                            "(ex. ?min_days=10)",
+            ),
+            OpenApiParameter(
+                "max_days",
+                type=int,
+                description="Filter by maximal days from borrow "
+                            "(ex. ?max_days=3)",
+            ),
+            OpenApiParameter(
+                "ordering",
+                type=str,
+                description="Order by id, borrow_date, "
+                            "expected_return_date or days_from_borrow, "
+                            "prefix with - for descending "
+                            "(ex. ?ordering=-days_from_borrow)",
             ),
             OpenApiParameter(
                 "user_id",
@@ -112,6 +227,11 @@ class BorrowingViewSet(viewsets.ModelViewSet):
                 user=user, borrowing=borrowing, status="PENDING"
             ).first()
 
+            if payment_pending and not payment_pending.session_url:
+                raise serializers.ValidationError(
+                    "You have to pay before returning the book. "
+                    "Your payment link is being created, try again soon."
+                )
             if payment_pending:
                 raise serializers.ValidationError(
                     f"You have to pay before returning the book. "
@@ -134,11 +254,8 @@ class BorrowingViewSet(viewsets.ModelViewSet):
                 "You have pending payments. Please pay them before borrowing."
             )
 
-        borrowing = serializer.save(user=user)
-
-        send_borrowing_notification(user, borrowing)
-
-        return borrowing
+        # the user is notified once the checkout session is created
+        return serializer.save(user=user)
 
     @extend_schema(
         description="Create new borrowing, "
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
 
 
 class LibraryConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "library"
+
+    def ready(self):
+        from library import signals
+
+        pre_migrate.connect(signals.create_trigram_extension, sender=self)
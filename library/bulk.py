@@ -0,0 +1,199 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from library.cache_helper import bump_catalogue_version
+from library.models import Book
+from library.serializers import BookImportSerializer
+
+BULK_FIELDS = ("title", "author", "cover", "inventory", "daily")
+BULK_BATCH_SIZE = 1000
+# an import with more invalid rows stops reporting them
+MAX_REPORTED_ERRORS = 100
+
+FILE_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+FILE_EXTENSIONS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+}
+
+
+class InvalidRows(ValidationError):
+    """
+    Lists every invalid row as {"row": <number>, "errors": {...}}. The
+    detail is kept as is, ValidationError would turn the row numbers
+    into strings
+    """
+
+    def __init__(self, errors):
+        super().__init__()
+        self.detail = {"rows": errors}
+
+
+def get_file_format(file_format, filename=""):
+    """The explicit format, else the one of the file extension"""
+    if not file_format:
+        for extension, extension_format in FILE_EXTENSIONS.items():
+            if filename.lower().endswith(extension):
+                file_format = extension_format
+    if file_format not in FILE_FORMATS:
+        raise ValidationError(
+            {
+                "file_format": f"Choose from: {', '.join(FILE_FORMATS)}"
+            }
+        )
+    return file_format
+
+
+def read_csv_rows(upload):
+    return csv.DictReader(codecs.iterdecode(upload, "utf-8-sig"))
+
+
+def read_ndjson_rows(upload):
+    """
+    Yields one object per line, a line that is not JSON is passed on
+    as text and fails validation as a row of its own
+    """
+    for line in codecs.iterdecode(upload, "utf-8-sig"):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line
+
+
+ROW_READERS = {
+    "csv": read_csv_rows,
+    "ndjson": read_ndjson_rows,
+}
+
+
+def batches(rows, batch_size):
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        yield batch
+
+
+def find_existing_books(keys):
+    """Maps (title, author) to the oldest book with that natural key"""
+    books = Book.objects.filter(
+        title__in={title for title, _ in keys},
+        author__in={author for _, author in keys},
+    ).only("id", "title", "author").order_by("-id")
+    return {
+        (book.title, book.author): book
+        for book in books
+        if (book.title, book.author) in keys
+    }
+
+
+def upsert_books(rows):
+    """
+    Creates the books whose title and author are new and updates the
+    others, one query each. The last row of a natural key wins
+    """
+    rows = {(row["title"], row["author"]): row for row in rows}
+    existing = find_existing_books(rows.keys())
+
+    new_books = []
+    changed_books = []
+    for key, row in rows.items():
+        book = existing.get(key)
+        if book is None:
+            new_books.append(Book(**row))
+            continue
+        for field, value in row.items():
+            setattr(book, field, value)
+        changed_books.append(book)
+
+    Book.objects.bulk_create(new_books)
+    Book.objects.bulk_update(changed_books, ["cover", "inventory", "daily"])
+    return len(new_books), len(changed_books)
+
+
+def import_books(upload, file_format, batch_size=None):
+    """
+    Validates and writes the rows batch by batch without reading the
+    whole file into memory. Nothing is saved if any row is invalid
+    """
+    batch_size = batch_size or BULK_BATCH_SIZE
+    created = updated = 0
+    errors = []
+
+    with transaction.atomic():
+        rows = ROW_READERS[file_format](upload)
+        for number, batch in enumerate(batches(rows, batch_size)):
+            serializer = BookImportSerializer(data=batch, many=True)
+            if not serializer.is_valid():
+                errors.extend(
+                    {
+                        "row": number * batch_size + index + 1,
+                        "errors": row_errors,
+                    }
+                    for index, row_errors in enumerate(serializer.errors)
+                    if row_errors
+                )
+                if len(errors) >= MAX_REPORTED_ERRORS:
+                    break
+            if errors:
+                continue
+
+            batch_created, batch_updated = upsert_books(
+                serializer.validated_data
+            )
+            created += batch_created
+            updated += batch_updated
+
+        if errors:
+            raise InvalidRows(errors[:MAX_REPORTED_ERRORS])
+
+        if created or updated:
+            bump_catalogue_version()
+
+    return {"created": created, "updated": updated}
+
+
+class Echo:
+    """A file-like object csv.writer can write single lines into"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows():
+    books = Book.objects.order_by("id").values_list(*BULK_FIELDS)
+    for row in books.iterator(chunk_size=BULK_BATCH_SIZE):
+        yield dict(zip(BULK_FIELDS, row))
+
+
+def export_csv():
+    writer = csv.writer(Echo())
+    yield writer.writerow(BULK_FIELDS)
+    for row in export_rows():
+        yield writer.writerow(row.values())
+
+
+def export_ndjson():
+    for row in export_rows():
+        yield json.dumps(row, default=str) + "\n"
+
+
+ROW_WRITERS = {
+    "csv": export_csv,
+    "ndjson": export_ndjson,
+}
+
+
+def export_books(file_format):
+    """Yields the catalogue in the import format, chunk by chunk"""
+    return ROW_WRITERS[file_format]()
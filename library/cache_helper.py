@@ -0,0 +1,95 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from borrowing.models import Borrowing
+
+CATALOGUE_VERSION_KEY = "catalogue:token"
+
+
+def _new_catalogue_version():
+    return uuid.uuid4().hex
+
+
+def get_catalogue_version(request):
+    """
+    Returns the token of the current catalogue version. It is read from
+    the cache once per request. There is no Last-Modified date on
+    purpose, it only has one-second precision and two changes within
+    the same second would answer If-Modified-Since with a stale 304
+    """
+    version = getattr(request, "catalogue_version", None)
+    if version is None:
+        version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        version = _new_catalogue_version()
+        if not cache.add(CATALOGUE_VERSION_KEY, version, timeout=None):
+            version = cache.get(CATALOGUE_VERSION_KEY, version)
+    request.catalogue_version = version
+    return version
+
+
+def bump_catalogue_version():
+    """
+    Starts a new catalogue version once the current transaction commits,
+    so a concurrent request can't cache the old rows under the new one
+    """
+    transaction.on_commit(
+        lambda: cache.set(
+            CATALOGUE_VERSION_KEY, _new_catalogue_version(), timeout=None
+        ),
+        robust=True,
+    )
+
+
+def get_catalogue_etag(request, *args, **kwargs):
+    """Differs per catalogue version and per URL, host and Accept header"""
+    token = get_catalogue_version(request)
+    representation = "|".join(
+        (
+            token,
+            request.get_host(),
+            request.get_full_path(),
+            request.META.get("HTTP_ACCEPT", ""),
+        )
+    )
+    return hashlib.md5(representation.encode()).hexdigest()
+
+
+def _catalogue_data_key(request):
+    return f"catalogue:data:{get_catalogue_etag(request)}"
+
+
+def get_cached_catalogue(request):
+    """Response data cached for this catalogue request, or None"""
+    return cache.get(_catalogue_data_key(request))
+
+
+def set_cached_catalogue(request, data):
+    cache.set(
+        _catalogue_data_key(request), data, settings.CATALOGUE_CACHE_TIMEOUT
+    )
+
+
+def _book_borrowing_stats_key(book_id):
+    return f"book:{book_id}:borrowing-stats"
+
+
+def get_book_borrowing_stats(book_id):
+    """Cached total, active and overdue borrowing counts of a book"""
+    key = _book_borrowing_stats_key(book_id)
+    stats = cache.get(key)
+    if stats is None:
+        stats = Borrowing.objects.filter(book_id=book_id).counts()
+        cache.set(key, stats, settings.BOOK_STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate_book_borrowing_stats(book_id):
+    transaction.on_commit(
+        lambda: cache.delete(_book_borrowing_stats_key(book_id)),
+        robust=True,
+    )
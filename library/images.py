@@ -0,0 +1,52 @@
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from library.models import book_image_variant_file_path
+
+# variant name -> the box the cover is scaled down into
+IMAGE_VARIANTS = {
+    "thumbnail": (160, 240),
+    "medium": (480, 720),
+}
+WEBP_QUALITY = 80
+
+
+def open_cover(book):
+    with book.image.open("rb") as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+
+    if image.mode in ("RGBA", "LA", "P"):
+        return image.convert("RGBA")
+    return image.convert("RGB")
+
+
+def render_variant(image, size):
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+
+    buffer = BytesIO()
+    variant.save(buffer, format="WEBP", quality=WEBP_QUALITY)
+    return buffer.getvalue()
+
+
+def generate_image_variants(book):
+    """
+    Writes a WebP of the cover for every IMAGE_VARIANTS size and returns
+    their storage names. An unchanged variant keeps its existing file
+    """
+    storage = book.image.storage
+    image = open_cover(book)
+
+    variants = {}
+    for name, size in IMAGE_VARIANTS.items():
+        content = render_variant(image, size)
+        digest = hashlib.sha256(content).hexdigest()[:16]
+        path = book_image_variant_file_path(book, name, digest)
+        if not storage.exists(path):
+            path = storage.save(path, ContentFile(content))
+        variants[name] = path
+    return variants
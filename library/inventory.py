@@ -0,0 +1,25 @@
+from django.db.models import F
+
+from library.cache_helper import bump_catalogue_version
+from library.models import Book
+
+
+def take_book(book):
+    """
+    Takes one copy of the book out of the inventory. The check and the
+    decrement are a single UPDATE, so concurrent checkouts can neither
+    lose an update nor take more copies than there are. Returns False
+    if no copy was left. The in-memory book is not refreshed.
+    """
+    taken = Book.objects.filter(id=book.id, inventory__gt=0).update(
+        inventory=F("inventory") - 1
+    )
+    if taken:
+        bump_catalogue_version()
+    return bool(taken)
+
+
+def return_book(book):
+    """Puts one copy of the book back into the inventory"""
+    Book.objects.filter(id=book.id).update(inventory=F("inventory") + 1)
+    bump_catalogue_version()
@@ -0,0 +1,112 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from borrowing.models import Borrowing
+from borrowing.overdue_sweep import overdue_borrowings
+from payment.models import Payment
+
+INDEXED_MODELS = (Borrowing, Payment)
+
+
+def restore_original_indexes(cursor):
+    """
+    Turns the borrowing and payment tables back into the schema before
+    the indexes were tuned: every index of their Meta is dropped and the
+    single-column foreign key indexes they replaced are created again
+    """
+    quote_name = connection.ops.quote_name
+    for model in INDEXED_MODELS:
+        for index in model._meta.indexes:
+            cursor.execute("DROP INDEX " + quote_name(index.name))
+        for field in model._meta.get_fields():
+            if field.many_to_one and field.concrete and not field.db_index:
+                cursor.execute(
+                    f"CREATE INDEX ON {quote_name(model._meta.db_table)} "
+                    f"({quote_name(field.column)})"
+                )
+
+
+def get_hot_queries(user_id, borrowing_id):
+    """The queries the borrowing and payment indexes are tuned for"""
+    return {
+        "borrowing list page": Borrowing.objects.filter(
+            user_id=user_id
+        ).order_by("-borrow_date", "-id")[:11],
+        "active borrowings of user": Borrowing.objects.filter(
+            user_id=user_id, actual_return_date__isnull=True
+        ),
+        "pending payments of user": Payment.objects.filter(
+            user_id=user_id, status="PENDING"
+        )[:1],
+        "pending payment of borrowing": Payment.objects.filter(
+            borrowing_id=borrowing_id, status="PENDING"
+        )[:1],
+        "overdue shard ids": overdue_borrowings()
+        .order_by("id")
+        .values_list("id", flat=True)[:200],
+        "overdue sweep chunk": overdue_borrowings()
+        .filter(id__gt=0)
+        .order_by("id")[:500],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints the EXPLAIN plans of the hot borrowing and payment queries. "
+        "Run it after seed_scale to see the plans on a large dataset"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run the queries and show the actual timings",
+        )
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            help="Also explain every query with the original foreign key "
+            "indexes instead of the tuned ones. The indexes are swapped "
+            "in a transaction that is rolled back, which locks both "
+            "tables meanwhile",
+        )
+
+    def explain(self, queries, analyze):
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(analyze=analyze))
+            self.stdout.write("")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("explain_queries needs PostgreSQL")
+
+        borrowing = (
+            Borrowing.objects.filter(actual_return_date__isnull=True)
+            .only("id", "user_id")
+            .first()
+        )
+        if borrowing is None:
+            raise CommandError(
+                "No active borrowings, fill the database with seed_scale"
+            )
+        queries = get_hot_queries(borrowing.user_id, borrowing.id)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "ANALYZE "
+                + ", ".join(model._meta.db_table for model in INDEXED_MODELS)
+            )
+
+        self.stdout.write(self.style.SUCCESS("With indexes"))
+        self.explain(queries, options["analyze"])
+
+        if not options["compare"]:
+            return
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                restore_original_indexes(cursor)
+            self.stdout.write(self.style.SUCCESS("With original indexes"))
+            self.explain(queries, options["analyze"])
+            transaction.set_rollback(True)
@@ -0,0 +1,255 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from borrowing.models import Borrowing
+from library.cache_helper import bump_catalogue_version
+from library.models import Book
+from payment.models import Payment
+from payment.pricing import FINE_MULTIPLIER, to_money
+
+# share of borrowings per state, the rest is returned on time
+OVERDUE_SHARE = 0.1
+ACTIVE_SHARE = 0.3
+RETURNED_LATE_SHARE = 0.15
+PENDING_SHARE = 0.05
+
+TITLE_WORDS = (
+    "Shadow", "River", "Winter", "Garden", "Silent", "Crimson", "Lost",
+    "Empire", "Glass", "Northern", "Hidden", "Storm", "Paper", "Golden",
+    "Last", "Iron", "Night", "Summer", "Broken", "Wild",
+)
+NAMES = (
+    "Anna", "Taras", "Olena", "Ivan", "Maria", "Petro", "Sofia", "Andrii",
+    "Iryna", "Dmytro", "Kateryna", "Oleh", "Yulia", "Bohdan", "Nadia",
+)
+
+
+def user_email(seed, number):
+    return f"user{number}.seed{seed}@seed.library"
+
+
+@contextmanager
+def explicit_borrow_dates():
+    """bulk_create would overwrite borrow_date with today otherwise"""
+    field = Borrowing._meta.get_field("borrow_date")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def batches(iterable_size, batch_size):
+    for start in range(0, iterable_size, batch_size):
+        yield range(start, min(start + batch_size, iterable_size))
+
+
+def make_borrowing(rng, today, book_id, user_id):
+    """Returns an unsaved borrowing in a random but realistic state"""
+    state = rng.random()
+    borrowing = Borrowing(book_id=book_id, user_id=user_id)
+
+    if state < OVERDUE_SHARE:
+        borrowing.borrow_date = today - timedelta(days=rng.randint(15, 60))
+        borrowing.expected_return_date = borrowing.borrow_date + timedelta(
+            days=rng.randint(1, 14)
+        )
+    elif state < OVERDUE_SHARE + ACTIVE_SHARE:
+        borrowing.borrow_date = today - timedelta(days=rng.randint(0, 13))
+        borrowing.expected_return_date = max(
+            today,
+            borrowing.borrow_date + timedelta(days=rng.randint(1, 14)),
+        )
+    else:
+        borrowing.borrow_date = today - timedelta(days=rng.randint(20, 730))
+        borrowing.expected_return_date = borrowing.borrow_date + timedelta(
+            days=rng.randint(1, 14)
+        )
+        if state < OVERDUE_SHARE + ACTIVE_SHARE + RETURNED_LATE_SHARE:
+            borrowing.actual_return_date = (
+                borrowing.expected_return_date
+                + timedelta(days=rng.randint(1, 10))
+            )
+        else:
+            borrowing.actual_return_date = max(
+                borrowing.borrow_date,
+                borrowing.expected_return_date
+                - timedelta(days=rng.randint(0, 3)),
+            )
+    return borrowing
+
+
+def make_payments(rng, seed, borrowing, daily):
+    """Returns the start payment and, for late returns, the fine"""
+    days = (borrowing.expected_return_date - borrowing.borrow_date).days + 1
+    payments = [
+        Payment(
+            status="PENDING" if rng.random() < PENDING_SHARE else "PAID",
+            type="PAYMENT",
+            borrowing_id=borrowing.id,
+            user_id=borrowing.user_id,
+            session_id=f"cs_seed_{seed}_{borrowing.id}",
+            session_url="https://checkout.stripe.com/c/pay/cs_seed",
+            money_to_pay=to_money(days * daily),
+        )
+    ]
+
+    if (
+        borrowing.actual_return_date
+        and borrowing.actual_return_date > borrowing.expected_return_date
+    ):
+        overdue_days = (
+            borrowing.actual_return_date - borrowing.expected_return_date
+        ).days
+        payments.append(
+            Payment(
+                status="PENDING" if rng.random() < PENDING_SHARE else "PAID",
+                type="FINE",
+                borrowing_id=borrowing.id,
+                user_id=borrowing.user_id,
+                session_id=f"cs_seed_{seed}_{borrowing.id}_fine",
+                session_url="https://checkout.stripe.com/c/pay/cs_seed",
+                money_to_pay=to_money(
+                    overdue_days * daily * FINE_MULTIPLIER
+                ),
+            )
+        )
+    return payments
+
+
+def seed_scale(
+    books,
+    users,
+    borrowings,
+    seed=42,
+    batch_size=5000,
+    password="seed-password",
+    log=None,
+):
+    """
+    Bulk-creates books, users, borrowings and their payments. The same
+    seed on the same day always produces the same data. Returns the
+    number of created rows per model.
+    """
+    rng = random.Random(seed)
+    today = timezone.now().date()
+    log = log or (lambda message: None)
+    user_model = get_user_model()
+
+    if user_model.objects.filter(email=user_email(seed, 0)).exists():
+        raise CommandError(
+            f"Data for seed {seed} already exists, use another --seed"
+        )
+
+    book_dailies = {}
+    for numbers in batches(books, batch_size):
+        created = Book.objects.bulk_create(
+            Book(
+                title=" ".join(rng.sample(TITLE_WORDS, 3)) + f" {number}",
+                author=f"{rng.choice(NAMES)} {rng.choice(NAMES)}enko",
+                cover=rng.choice("HS"),
+                inventory=rng.randint(0, 20),
+                daily=Decimal(rng.randint(50, 500)) / 100,
+            )
+            for number in numbers
+        )
+        book_dailies.update((book.id, book.daily) for book in created)
+        log(f"Books: {len(book_dailies)}/{books}")
+    book_ids = list(book_dailies)
+    # bulk_create sends no post_save signals
+    bump_catalogue_version()
+
+    hashed_password = make_password(password)
+    user_ids = []
+    for numbers in batches(users, batch_size):
+        created = user_model.objects.bulk_create(
+            user_model(
+                email=user_email(seed, number),
+                password=hashed_password,
+                first_name=rng.choice(NAMES),
+            )
+            for number in numbers
+        )
+        user_ids.extend(user.id for user in created)
+        log(f"Users: {len(user_ids)}/{users}")
+
+    borrowing_count = 0
+    payment_count = 0
+    with explicit_borrow_dates():
+        for numbers in batches(borrowings, batch_size):
+            with transaction.atomic():
+                created = Borrowing.objects.bulk_create(
+                    make_borrowing(
+                        rng, today, rng.choice(book_ids), rng.choice(user_ids)
+                    )
+                    for _ in numbers
+                )
+                payments = Payment.objects.bulk_create(
+                    payment
+                    for borrowing in created
+                    for payment in make_payments(
+                        rng, seed, borrowing, book_dailies[borrowing.book_id]
+                    )
+                )
+            borrowing_count += len(created)
+            payment_count += len(payments)
+            log(f"Borrowings: {borrowing_count}/{borrowings}")
+
+    return {
+        "books": len(book_ids),
+        "users": len(user_ids),
+        "borrowings": borrowing_count,
+        "payments": payment_count,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generates books, users, borrowings (active, overdue and "
+        "returned) and their payments for profiling and benchmarking"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--borrowings", type=int, default=10000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=42,
+            help="Same seed gives the same data, users are unique per seed",
+        )
+        parser.add_argument("--password", default="seed-password")
+
+    def handle(self, *args, **options):
+        if min(options["books"], options["users"]) <= 0:
+            raise CommandError("--books and --users must be positive")
+
+        started = time.monotonic()
+        created = seed_scale(
+            books=options["books"],
+            users=options["users"],
+            borrowings=options["borrowings"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            password=options["password"],
+            log=self.stdout.write,
+        )
+        summary = ", ".join(
+            f"{count} {name}" for name, count in created.items()
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {summary} in {time.monotonic() - started:.1f}s"
+            )
+        )
@@ -1,10 +1,15 @@
 import os
 import uuid
 
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.text import slugify
 
+from library.search import BOOK_SEARCH_VECTOR
+
+COUNTER_FIELDS = {"inventory"}
+
 
 def book_image_file_path(instance, filename):
     _, extension = os.path.splitext(filename)
@@ -13,6 +18,13 @@ def book_image_file_path(instance, filename):
     return os.path.join("uploads/book/", filename)
 
 
+def book_image_variant_file_path(instance, variant, digest):
+    """Variants are named by their content, so a name never changes"""
+    filename = f"{slugify(instance.title)}-{variant}-{digest}.webp"
+
+    return os.path.join("uploads/book/variants/", filename)
+
+
 class Book(models.Model):
     COVER_CHOICES = [
         ("H", "HARD"),
@@ -28,6 +40,24 @@ class Book(models.Model):
         blank=True,
         upload_to=book_image_file_path
     )
+    # variant name -> storage name, filled in by library.tasks
+    image_variants = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(BOOK_SEARCH_VECTOR, name="book_search_vector_idx"),
+            # pg_trgm is installed by library.signals before migrations
+            GinIndex(
+                fields=["title"],
+                name="book_title_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+            GinIndex(
+                fields=["author"],
+                name="book_author_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
 
     @staticmethod
     def validate_cover_choice(cover, error_to_raise):
@@ -51,7 +81,10 @@ class Book(models.Model):
             using=None,
             update_fields=None
     ):
-        self.full_clean()
+        # counter updates skip the full model validation, the database
+        # still rejects a negative inventory
+        if not update_fields or not set(update_fields) <= COUNTER_FIELDS:
+            self.full_clean()
 
         return super().save(force_insert, force_update, using, update_fields)
 
@@ -0,0 +1,54 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+SEARCH_CONFIG = "english"
+
+# Book.Meta has a GIN index on exactly this expression, any change here
+# has to be made there too or the search falls back to a sequential scan
+BOOK_SEARCH_VECTOR = SearchVector(
+    "title", weight="A", config=SEARCH_CONFIG
+) + SearchVector("author", weight="B", config=SEARCH_CONFIG)
+
+
+def full_text_search(queryset, text):
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+    return (
+        queryset.annotate(search=BOOK_SEARCH_VECTOR)
+        .filter(search=query)
+        .annotate(rank=SearchRank(F("search"), query))
+        .order_by("-rank", "id")
+    )
+
+
+def trigram_search(queryset, text):
+    """Matches misspelled words, uses the trigram indexes of Book"""
+    return (
+        queryset.filter(
+            Q(title__trigram_word_similar=text)
+            | Q(author__trigram_word_similar=text)
+        )
+        .annotate(
+            rank=Greatest(
+                TrigramWordSimilarity(text, "title"),
+                TrigramWordSimilarity(text, "author"),
+            )
+        )
+        .order_by("-rank", "id")
+    )
+
+
+def search_books(queryset, text):
+    """
+    Ranked full-text search over title and author, falling back to
+    trigram similarity when no book contains the words (e.g. a typo)
+    """
+    books = full_text_search(queryset, text)
+    if books.exists():
+        return books
+    return trigram_search(queryset, text)
@@ -1,10 +1,12 @@
 from rest_framework import serializers
 
+from library.cache_helper import get_book_borrowing_stats
 from library.models import Book
 
 
 class BookSerializer(serializers.ModelSerializer):
     cover = serializers.ChoiceField(choices=Book.COVER_CHOICES)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
@@ -16,22 +18,49 @@ class BookSerializer(serializers.ModelSerializer):
             "inventory",
             "daily",
             "image",
+            "image_variants",
         )
 
     def validate(self, attrs):
-        Book.validate_cover_choice(attrs["cover"], serializers.ValidationError)
+        # a partial update may leave the cover out
+        if "cover" in attrs:
+            Book.validate_cover_choice(
+                attrs["cover"], serializers.ValidationError
+            )
         data = super().validate(attrs)
         return data
 
+    def get_image_variants(self, obj):
+        """URLs of the resized covers, empty until they are rendered"""
+        storage = Book._meta.get_field("image").storage
+        request = self.context.get("request")
+
+        urls = {}
+        for name, path in obj.image_variants.items():
+            url = storage.url(path)
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        cover_value = instance.get_cover_display()
-        representation["cover"] = cover_value
+        if "cover" in representation:
+            cover_value = instance.get_cover_display()
+            representation["cover"] = cover_value
         return representation
 
 
+class BookListSerializer(BookSerializer):
+    """Renders only the `fields` it is given, or all of them"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
 class BookDetailSerializer(BookSerializer):
-    borrowings = serializers.SerializerMethodField()
+    borrowing_stats = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
@@ -42,14 +71,32 @@ class BookDetailSerializer(BookSerializer):
             "cover",
             "inventory",
             "daily",
-            "borrowings",
+            "borrowing_stats",
             "image",
+            "image_variants",
         )
 
-    def get_borrowings(self, obj):
-        borrowing_objects = obj.borrowings.all()
-        user_emails = borrowing_objects.values_list("user__email", flat=True)
-        return user_emails
+    def get_borrowing_stats(self, obj):
+        return get_book_borrowing_stats(obj.id)
+
+
+class BookInventorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Book
+        fields = ("id", "inventory")
+
+    def update(self, instance, validated_data):
+        instance.inventory = validated_data["inventory"]
+        instance.save(update_fields=["inventory"])
+        return instance
+
+
+class BookImportSerializer(BookSerializer):
+    """One row of a bulk import, the book is found by title and author"""
+
+    class Meta:
+        model = Book
+        fields = ("title", "author", "cover", "inventory", "daily")
 
 
 class BookImageSerializer(serializers.ModelSerializer):
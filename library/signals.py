@@ -0,0 +1,47 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from borrowing.models import Borrowing
+from library.cache_helper import (
+    bump_catalogue_version,
+    invalidate_book_borrowing_stats,
+)
+from library.models import Book
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_catalogue(sender, **kwargs):
+    bump_catalogue_version()
+
+
+@receiver(post_save, sender=Borrowing)
+@receiver(post_delete, sender=Borrowing)
+def invalidate_borrowing_stats(sender, instance, **kwargs):
+    invalidate_book_borrowing_stats(instance.book_id)
+
+
+def create_trigram_extension(sender, using, **kwargs):
+    """
+    Book has trigram indexes, but makemigrations can't write the
+    extension into the generated migrations, so migrate creates it first.
+    Without it the index migration and the search would fail later with
+    a less obvious error, so migrate stops here instead
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if not cursor.fetchone():
+            raise ImproperlyConfigured(
+                "The pg_trgm extension isn't available on database "
+                f"'{using}', it's needed by the book search indexes. "
+                "Install the PostgreSQL contrib package (postgresql-contrib) "
+                "on the database server."
+            )
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
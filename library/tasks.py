@@ -0,0 +1,28 @@
+from celery import shared_task
+
+from library.cache_helper import bump_catalogue_version
+from library.images import generate_image_variants
+from library.models import Book
+
+
+@shared_task
+def process_book_image(book_id):
+    """
+    Renders the cover variants of a book. They are only stored if the
+    cover wasn't replaced meanwhile, the newer upload has its own task
+    """
+    book = (
+        Book.objects.filter(id=book_id)
+        .only("id", "title", "image")
+        .first()
+    )
+    if book is None or not book.image:
+        return None
+
+    variants = generate_image_variants(book)
+    updated = Book.objects.filter(id=book.id, image=book.image.name).update(
+        image_variants=variants
+    )
+    if updated:
+        bump_catalogue_version()
+    return variants
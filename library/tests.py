@@ -1,21 +1,44 @@
+import hashlib
 import os
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from unittest import mock
 import datetime
 from decimal import Decimal
 
 from PIL import Image
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from borrowing.models import Borrowing
+from library import bulk
+from library.cache_helper import get_book_borrowing_stats
+from library.images import IMAGE_VARIANTS
+from library.inventory import return_book, take_book
+from library.management.commands.explain_queries import (
+    INDEXED_MODELS,
+    restore_original_indexes,
+)
 from library.models import Book
+from library.signals import create_trigram_extension
+from library.tasks import process_book_image
+from library.uploads import locked_upload
+from library_config.testing import TestCase, TransactionTestCase
+from payment.models import Payment
 
 BOOK_URL = reverse("library:book-list")
+BULK_URL = reverse("library:book-bulk")
 
 
 def sample_book(**params):
@@ -39,6 +62,10 @@ def detail_url(book_id):
     return reverse("library:book-detail", args=[book_id])
 
 
+def inventory_url(book_id):
+    return reverse("library:book-update-inventory", args=[book_id])
+
+
 class BookImageUploadTests(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -66,6 +93,22 @@ class BookImageUploadTests(TestCase):
         self.assertIn("image", res.data)
         self.assertTrue(os.path.exists(self.book.image.path))
 
+    def test_upload_image_schedules_variants(self):
+        url = image_upload_url(self.book.id)
+
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as ntf:
+            img = Image.new("RGB", (10, 10))
+            img.save(ntf, format="JPEG")
+            ntf.seek(0)
+            with mock.patch("library.views.process_book_image") as task, \
+                    self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(
+                    url, {"image": ntf}, format="multipart"
+                )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        task.delay.assert_called_once_with(self.book.id)
+
     def test_upload_image_bad_request(self):
         url = image_upload_url(self.book.id)
         res = self.client.post(url, {"image": "not image"}, format="multipart")
@@ -115,7 +158,173 @@ class BookImageUploadTests(TestCase):
             self.client.post(url, {"image": ntf}, format="multipart")
         res = self.client.get(BOOK_URL)
 
-        self.assertIn("image", res.data[0].keys())
+        self.assertIn("image", res.data["results"][0].keys())
+
+
+class BookImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        cover = BytesIO()
+        Image.new("RGB", (600, 900), "navy").save(cover, format="JPEG")
+        self.book = sample_book(
+            title="Dune",
+            image=SimpleUploadedFile("dune.jpg", cover.getvalue()),
+        )
+
+    def test_variants_are_resized_webp(self):
+        variants = process_book_image(self.book.id)
+
+        self.assertEqual(set(variants), set(IMAGE_VARIANTS))
+        for name, path in variants.items():
+            with self.book.image.storage.open(path) as file:
+                image = Image.open(file)
+                self.assertEqual(image.format, "WEBP")
+                self.assertLessEqual(image.size, IMAGE_VARIANTS[name])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.image_variants, variants)
+
+    def test_variant_names_follow_the_content(self):
+        self.assertEqual(
+            process_book_image(self.book.id),
+            process_book_image(self.book.id),
+        )
+
+    def test_variant_urls_are_listed(self):
+        variants = process_book_image(self.book.id)
+
+        res = APIClient().get(BOOK_URL)
+
+        self.assertEqual(
+            res.data["results"][0]["image_variants"]["thumbnail"],
+            "http://testserver/media/" + variants["thumbnail"],
+        )
+
+
+class BookChunkedImageUploadTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(directory.name, "media"),
+            BOOK_IMAGE_UPLOAD_DIR=os.path.join(directory.name, "uploads"),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_superuser(
+                "admin@test.com", "pass"
+            )
+        )
+        self.book = sample_book()
+        self.url = reverse(
+            "library:book-upload-image-chunk", args=[self.book.id]
+        )
+
+        cover = BytesIO()
+        Image.new("RGB", (300, 450), "navy").save(cover, format="PNG")
+        self.content = cover.getvalue()
+
+    def put_chunk(self, start, end, content=None, total=None):
+        total = total or len(self.content)
+        content_range = (
+            f"bytes */{total}" if start is None
+            else f"bytes {start}-{end}/{total}"
+        )
+        return self.client.put(
+            self.url,
+            self.content[start:end + 1] if content is None else content,
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=content_range,
+        )
+
+    def test_upload_in_chunks(self):
+        middle = len(self.content) // 2
+
+        res = self.put_chunk(0, middle - 1)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data["received"], middle)
+        self.assertEqual(res["Range"], f"bytes=0-{middle - 1}")
+
+        with mock.patch("library.views.process_book_image") as task, \
+                self.captureOnCommitCallbacks(execute=True):
+            res = self.put_chunk(middle, len(self.content) - 1)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data["sha256"], hashlib.sha256(self.content).hexdigest()
+        )
+        task.delay.assert_called_once_with(self.book.id)
+        self.book.refresh_from_db()
+        with self.book.image.open("rb") as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertFalse(os.listdir(settings.BOOK_IMAGE_UPLOAD_DIR))
+
+    def test_resume_after_interrupted_chunk(self):
+        self.put_chunk(0, 99, content=self.content[:40])
+
+        res = self.put_chunk(None, None, content=b"")
+        self.assertEqual(res.data["received"], 40)
+
+        res = self.put_chunk(40, len(self.content) - 1)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data["sha256"], hashlib.sha256(self.content).hexdigest()
+        )
+
+    def test_chunk_must_continue_the_upload(self):
+        self.put_chunk(0, 99)
+
+        res = self.put_chunk(200, 299)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_chunk_must_keep_the_total(self):
+        self.put_chunk(0, 99)
+
+        res = self.put_chunk(100, 199, total=len(self.content) + 1)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data["detail"].code, "total_mismatch")
+
+    def test_one_chunk_at_a_time(self):
+        with locked_upload(self.book):
+            res = self.put_chunk(0, 99)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(
+            self.put_chunk(0, 99).status_code, status.HTTP_202_ACCEPTED
+        )
+
+    @override_settings(BOOK_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_upload_size_is_capped(self):
+        res = self.put_chunk(0, 99)
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    def test_upload_must_be_an_image(self):
+        self.content = b"not an image" * 10
+
+        res = self.put_chunk(0, len(self.content) - 1)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.book.refresh_from_db()
+        self.assertFalse(self.book.image)
+
+    def test_content_range_is_required(self):
+        res = self.client.put(
+            self.url, self.content, content_type="application/octet-stream"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
 
 class UnauthenticatedBookAPITests(TestCase):
@@ -195,6 +404,21 @@ class AuthenticatedBookAPITest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
 
 
+class BookBorrowingsPermissionTests(TestCase):
+    def test_book_borrowings_are_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(
+            get_user_model().objects.create_user("user@test.com", "pass")
+        )
+        book = sample_book()
+
+        response = client.get(
+            reverse("library:book-borrowings", args=[book.id])
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
 class AdminMovieAPITests(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -246,10 +470,581 @@ class AdminMovieAPITests(TestCase):
             user=self.user,
         )
 
+        Borrowing.objects.create(
+            expected_return_date=datetime.date.today(),
+            actual_return_date=datetime.date.today(),
+            book=book,
+            user=self.user,
+        )
+        overdue = Borrowing.objects.create(
+            expected_return_date=datetime.date.today(),
+            book=book,
+            user=self.user,
+        )
+        Borrowing.objects.filter(id=overdue.id).update(
+            expected_return_date=(
+                datetime.date.today() - datetime.timedelta(days=1)
+            )
+        )
+
         url = detail_url(book.id)
-        response = self.client.get(url)
+        # book + all borrowing counts in one query
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["borrowing_stats"],
+            {"total": 3, "active": 2, "overdue": 1},
+        )
+
+    def test_list_book_borrowings(self):
+        book = sample_book()
+        borrowings = [
+            Borrowing.objects.create(
+                expected_return_date=(
+                    datetime.date.today() + datetime.timedelta(days=13)
+                ),
+                book=book,
+                user=self.user,
+            )
+            for _ in range(3)
+        ]
+        url = reverse("library:book-borrowings", args=[book.id])
+
+        response = self.client.get(url, {"page_size": 2})
+        next_response = self.client.get(response.data["next"])
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn("borrowings", response.data)
-        self.assertEqual(len(response.data["borrowings"]), 1)
-        self.assertIn(str(self.user.email), response.data["borrowings"])
+        self.assertEqual(
+            [borrowing["id"] for borrowing in response.data["results"]]
+            + [borrowing["id"] for borrowing in next_response.data["results"]],
+            [borrowing.id for borrowing in reversed(borrowings)],
+        )
+        self.assertEqual(
+            response.data["results"][0]["user"], self.user.email
+        )
+
+
+class BookSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.dune = sample_book(title="Dune", author="Frank Herbert")
+        self.garden = sample_book(
+            title="Herbert's Garden", author="Anna Smith"
+        )
+        sample_book(title="Dark Matter", author="Blake Crouch")
+
+    def test_search_ranks_title_matches_above_author_matches(self):
+        res = self.client.get(BOOK_URL, {"search": "herbert"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["count"], 2)
+        self.assertEqual(
+            [book["id"] for book in res.data["results"]],
+            [self.garden.id, self.dune.id],
+        )
+
+    def test_search_matches_word_forms(self):
+        res = self.client.get(BOOK_URL, {"search": "gardens"})
+
+        self.assertEqual(
+            [book["id"] for book in res.data["results"]], [self.garden.id]
+        )
+
+    def test_search_falls_back_to_trigrams_for_typos(self):
+        res = self.client.get(BOOK_URL, {"search": "Herbret"})
+
+        self.assertEqual(
+            {book["id"] for book in res.data["results"]},
+            {self.dune.id, self.garden.id},
+        )
+
+    def test_list_without_search_is_ordered_by_id(self):
+        res = self.client.get(BOOK_URL)
+
+        self.assertEqual(res.data["count"], 3)
+        self.assertEqual(
+            [book["id"] for book in res.data["results"]],
+            sorted(book["id"] for book in res.data["results"]),
+        )
+
+
+class TrigramExtensionTests(SimpleTestCase):
+    def migrate_with_extension(self, available):
+        connection = mock.MagicMock(vendor="postgresql")
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (1,) if available else None
+        with mock.patch(
+            "library.signals.connections", {"default": connection}
+        ):
+            create_trigram_extension(sender=None, using="default")
+        return cursor
+
+    def test_extension_is_created_before_migrations(self):
+        cursor = self.migrate_with_extension(available=True)
+
+        cursor.execute.assert_called_with(
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+        )
+
+    def test_missing_extension_stops_migrate(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "pg_trgm"):
+            self.migrate_with_extension(available=False)
+
+
+class BookFieldsProjectionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for number in range(3):
+            sample_book(title=f"Book {number}")
+
+    def test_list_returns_only_requested_fields(self):
+        res = self.client.get(BOOK_URL, {"fields": "id,title,inventory"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for book in res.data["results"]:
+            self.assertEqual(set(book), {"id", "title", "inventory"})
+
+    def test_projection_loads_only_requested_columns(self):
+        # count + page, cover is not loaded for its display value
+        with self.assertNumQueries(2) as context:
+            self.client.get(BOOK_URL, {"fields": "title"})
+
+        page_query = context.captured_queries[-1]["sql"]
+        self.assertIn('"title"', page_query)
+        self.assertNotIn('"author"', page_query)
+        self.assertNotIn('"cover"', page_query)
+
+    def test_unknown_field_is_rejected(self):
+        res = self.client.get(BOOK_URL, {"fields": "title,password"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("password", res.data["fields"])
+
+    def test_list_is_paginated(self):
+        res = self.client.get(BOOK_URL, {"page_size": 2})
+
+        self.assertEqual(res.data["count"], 3)
+        self.assertEqual(len(res.data["results"]), 2)
+        self.assertIsNotNone(res.data["next"])
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+    }
+)
+class CatalogueCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.book = sample_book()
+
+    def test_catalogue_is_served_from_cache(self):
+        with self.assertNumQueries(2):
+            res = self.client.get(BOOK_URL)
+        with self.assertNumQueries(0):
+            cached_res = self.client.get(BOOK_URL)
+
+        self.assertEqual(cached_res.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached_res.data, res.data)
+
+    def test_book_save_and_delete_invalidate_catalogue(self):
+        self.client.get(BOOK_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.inventory = 3
+            self.book.save()
+        res = self.client.get(BOOK_URL)
+        self.assertEqual(res.data["results"][0]["inventory"], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.delete()
+        res = self.client.get(BOOK_URL)
+        self.assertEqual(res.data["results"], [])
+
+    def test_unchanged_catalogue_returns_not_modified(self):
+        res = self.client.get(BOOK_URL)
+
+        with self.assertNumQueries(0):
+            etag_res = self.client.get(
+                BOOK_URL, HTTP_IF_NONE_MATCH=res["ETag"]
+            )
+
+        self.assertEqual(etag_res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_catalogue_has_no_last_modified_date(self):
+        # one-second precision, changes within a second would look unchanged
+        res = self.client.get(BOOK_URL)
+
+        self.assertNotIn("Last-Modified", res)
+
+    def test_changed_catalogue_returns_new_etag(self):
+        res = self.client.get(BOOK_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sample_book(title="Another book")
+        new_res = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=res["ETag"])
+
+        self.assertEqual(new_res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(new_res["ETag"], res["ETag"])
+        self.assertEqual(new_res.data["count"], 2)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+    }
+)
+class BookBorrowingStatsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "pass"
+        )
+        self.book = sample_book()
+
+    def borrow(self):
+        return Borrowing.objects.create(
+            expected_return_date=(
+                datetime.date.today() + datetime.timedelta(days=3)
+            ),
+            book=self.book,
+            user=self.user,
+        )
+
+    def test_stats_are_cached_until_a_borrowing_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrow()
+
+        with self.assertNumQueries(1):
+            stats = get_book_borrowing_stats(self.book.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_book_borrowing_stats(self.book.id), stats)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrow()
+
+        self.assertEqual(get_book_borrowing_stats(self.book.id)["total"], 2)
+
+
+class InventoryTests(TestCase):
+    def test_take_book_stops_at_zero(self):
+        book = sample_book(inventory=1)
+
+        self.assertTrue(take_book(book))
+        self.assertFalse(take_book(book))
+
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 0)
+
+    def test_return_book_adds_a_copy(self):
+        book = sample_book(inventory=0)
+
+        return_book(book)
+
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 1)
+
+    def test_inventory_save_skips_full_clean(self):
+        book = sample_book()
+        book.inventory = 3
+
+        with mock.patch.object(Book, "full_clean") as full_clean:
+            book.save(update_fields=["inventory"])
+            full_clean.assert_not_called()
+
+            book.save(update_fields=["inventory", "title"])
+            full_clean.assert_called_once()
+
+    def test_admin_can_set_inventory(self):
+        client = APIClient()
+        client.force_authenticate(
+            get_user_model().objects.create_superuser(
+                "admin@test.com", "pass"
+            )
+        )
+        book = sample_book(inventory=1)
+
+        response = client.patch(inventory_url(book.id), {"inventory": 7})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"id": book.id, "inventory": 7})
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 7)
+
+    def test_inventory_cannot_be_negative(self):
+        client = APIClient()
+        client.force_authenticate(
+            get_user_model().objects.create_superuser(
+                "admin@test.com", "pass"
+            )
+        )
+        book = sample_book(inventory=1)
+
+        response = client.patch(inventory_url(book.id), {"inventory": -1})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_user_cannot_set_inventory(self):
+        client = APIClient()
+        client.force_authenticate(
+            get_user_model().objects.create_user("user@test.com", "pass")
+        )
+        book = sample_book(inventory=1)
+
+        response = client.patch(inventory_url(book.id), {"inventory": 7})
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class InventoryConcurrencyTests(TransactionTestCase):
+    """Many threads with their own connections hammer a single book"""
+
+    THREADS = 16
+    ROUNDS = 25
+
+    def run_in_threads(self, work):
+        def run(number):
+            try:
+                return work(number)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            return list(executor.map(run, range(self.THREADS)))
+
+    def test_concurrent_takes_and_returns_lose_no_update(self):
+        book = sample_book(inventory=self.THREADS * self.ROUNDS)
+
+        def work(number):
+            for _ in range(self.ROUNDS):
+                take_book(book)
+                if number % 2:
+                    return_book(book)
+
+        self.run_in_threads(work)
+
+        book.refresh_from_db()
+        # every even thread kept its copies, every odd one gave them back
+        self.assertEqual(
+            book.inventory, self.THREADS * self.ROUNDS // 2
+        )
+
+    def test_concurrent_takes_never_oversell(self):
+        book = sample_book(inventory=self.THREADS)
+
+        def work(number):
+            return sum(take_book(book) for _ in range(self.ROUNDS))
+
+        taken = self.run_in_threads(work)
+
+        book.refresh_from_db()
+        self.assertEqual(sum(taken), self.THREADS)
+        self.assertEqual(book.inventory, 0)
+
+
+class BookBulkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_superuser(
+                "admin@test.com", "pass"
+            )
+        )
+
+    def upload(self, name, content, **params):
+        return self.client.post(
+            BULK_URL + "?" + "&".join(f"{k}={v}" for k, v in params.items()),
+            {"file": SimpleUploadedFile(name, content.encode())},
+            format="multipart",
+        )
+
+    def test_csv_import_creates_and_updates_books(self):
+        book = sample_book(title="Dune", author="Frank Herbert", inventory=1)
+        content = (
+            "title,author,cover,inventory,daily\n"
+            "Dune,Frank Herbert,S,5,2.50\n"
+            "Emma,Jane Austen,H,3,1.00\n"
+        )
+
+        with self.assertNumQueries(5):
+            response = self.upload("books.csv", content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"created": 1, "updated": 1})
+        book.refresh_from_db()
+        self.assertEqual((book.cover, book.inventory), ("S", 5))
+        self.assertEqual(book.daily, Decimal("2.50"))
+        self.assertTrue(Book.objects.filter(title="Emma").exists())
+
+    def test_ndjson_import_in_batches(self):
+        content = "".join(
+            f'{{"title": "Book {number}", "author": "Author", '
+            f'"cover": "H", "inventory": 1, "daily": "1.00"}}\n'
+            for number in range(5)
+        )
+
+        with mock.patch.object(bulk, "BULK_BATCH_SIZE", 2), \
+                self.assertNumQueries(8):
+            response = self.client.post(
+                BULK_URL,
+                {"file": SimpleUploadedFile("books.ndjson", content.encode())},
+                format="multipart",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["created"], 5)
+        self.assertEqual(Book.objects.count(), 5)
+
+    def test_invalid_row_rolls_back_the_import(self):
+        content = (
+            '{"title": "Dune", "author": "Frank Herbert", "cover": "H", '
+            '"inventory": 1, "daily": "1.00"}\n'
+            '{"title": "Emma", "author": "Jane Austen", "cover": "X", '
+            '"inventory": 1, "daily": "1.00"}\n'
+            "not json\n"
+        )
+
+        response = self.upload("books.txt", content, file_format="ndjson")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [error["row"] for error in response.json()["rows"]], [2, 3]
+        )
+        self.assertIn("cover", response.data["rows"][0]["errors"])
+        self.assertFalse(Book.objects.exists())
+
+    def test_unknown_file_format_is_rejected(self):
+        response = self.upload("books.xml", "<books/>")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_round_trips_through_import(self):
+        sample_book(title="Dune", author="Frank Herbert")
+        sample_book(title="Emma", author="Jane Austen", cover="S")
+
+        for file_format in bulk.FILE_FORMATS:
+            response = self.client.get(BULK_URL, {"file_format": file_format})
+            self.assertTrue(response.streaming)
+            content = b"".join(response.streaming_content).decode()
+
+            response = self.upload(
+                f"books.{file_format}", content, file_format=file_format
+            )
+
+            self.assertEqual(response.data, {"created": 0, "updated": 2})
+
+    def test_export_csv(self):
+        sample_book(title="Dune", author="Frank Herbert")
+
+        response = self.client.get(BULK_URL)
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(
+            b"".join(response.streaming_content).decode().splitlines(),
+            [
+                "title,author,cover,inventory,daily",
+                "Dune,Frank Herbert,H,10,19.99",
+            ],
+        )
+
+    def test_bulk_is_admin_only(self):
+        self.client.force_authenticate(
+            get_user_model().objects.create_user("user@test.com", "pass")
+        )
+
+        response = self.client.get(BULK_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class SeedScaleCommandTests(TestCase):
+    def test_seed_scale_creates_requested_rows(self):
+        call_command(
+            "seed_scale",
+            books=20,
+            users=10,
+            borrowings=300,
+            batch_size=64,
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(Book.objects.count(), 20)
+        self.assertEqual(get_user_model().objects.count(), 10)
+        self.assertEqual(Borrowing.objects.count(), 300)
+        self.assertTrue(
+            Borrowing.objects.filter(actual_return_date__isnull=True).exists()
+        )
+        self.assertTrue(
+            Borrowing.objects.filter(
+                actual_return_date__isnull=False
+            ).exists()
+        )
+        self.assertEqual(
+            Payment.objects.filter(type="PAYMENT").count(), 300
+        )
+        self.assertTrue(Payment.objects.filter(type="FINE").exists())
+
+    def test_seed_scale_refuses_used_seed(self):
+        options = {"books": 1, "users": 1, "borrowings": 0, "seed": 7}
+        call_command("seed_scale", stdout=StringIO(), **options)
+
+        with self.assertRaises(CommandError):
+            call_command("seed_scale", **options)
+
+
+class ExplainQueriesCommandTests(TestCase):
+    def test_explain_queries_restores_dropped_indexes(self):
+        call_command(
+            "seed_scale", books=5, users=5, borrowings=50, stdout=StringIO()
+        )
+        # the test transaction still holds the deferred foreign key
+        # checks of the seeded rows, CREATE INDEX refuses to run then
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        out = StringIO()
+
+        call_command("explain_queries", compare=True, stdout=out)
+
+        self.assertIn("With original indexes", out.getvalue())
+        self.assertIn("overdue sweep chunk", out.getvalue())
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Borrowing._meta.db_table
+            )
+        self.assertIn("borrowing_active_due_idx", constraints)
+        self.assertNotIn(
+            ["user_id"],
+            [
+                constraint["columns"]
+                for constraint in constraints.values()
+                if constraint["index"]
+            ],
+        )
+
+    def test_original_schema_keeps_foreign_key_indexes(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            restore_original_indexes(cursor)
+            indexed = {
+                (model._meta.db_table, tuple(constraint["columns"]))
+                for model in INDEXED_MODELS
+                for constraint in connection.introspection.get_constraints(
+                    cursor, model._meta.db_table
+                ).values()
+                if constraint["index"]
+            }
+            transaction.set_rollback(True)
+
+        self.assertIn(("borrowing_borrowing", ("user_id",)), indexed)
+        self.assertIn(("payment_payment", ("user_id",)), indexed)
+        self.assertIn(("payment_payment", ("borrowing_id",)), indexed)
+        self.assertNotIn(
+            ("borrowing_borrowing", ("user_id", "actual_return_date")),
+            indexed,
+        )
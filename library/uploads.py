@@ -0,0 +1,222 @@
+import fcntl
+import hashlib
+import os
+import re
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE = re.compile(r"^bytes (?:(\d+)-(\d+)|\*)/(\d+)$")
+
+# start and end are None when the client only asks how much arrived
+ContentRange = namedtuple("ContentRange", ("start", "end", "total"))
+UploadProgress = namedtuple("UploadProgress", ("received", "total", "sha256"))
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "The file is too large."
+    default_code = "too_large"
+
+
+class UploadOffsetMismatch(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The chunk doesn't continue the upload."
+    default_code = "offset_mismatch"
+
+
+class UploadTotalMismatch(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The chunk declares another total size."
+    default_code = "total_mismatch"
+
+
+class UploadInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = (
+        "Another chunk of this upload is being received, try again."
+    )
+    default_code = "upload_in_progress"
+
+
+def parse_content_range(header):
+    match = CONTENT_RANGE.match(header or "")
+    if match is None:
+        raise ValidationError(
+            {
+                "Content-Range": "Expected bytes <start>-<end>/<total> "
+                "or bytes */<total>."
+            }
+        )
+
+    start, end, total = (
+        None if value is None else int(value) for value in match.groups()
+    )
+    if start is not None and not start <= end < total:
+        raise ValidationError({"Content-Range": "Invalid byte range."})
+    if total > settings.BOOK_IMAGE_MAX_UPLOAD_SIZE:
+        raise UploadTooLarge(
+            f"The file can't be larger than "
+            f"{settings.BOOK_IMAGE_MAX_UPLOAD_SIZE} bytes."
+        )
+    return ContentRange(start, end, total)
+
+
+def partial_upload_path(book):
+    return os.path.join(
+        settings.BOOK_IMAGE_UPLOAD_DIR, f"book-{book.id}.part"
+    )
+
+
+def upload_lock_path(book):
+    # holds the total declared by the first chunk of the upload
+    return os.path.join(
+        settings.BOOK_IMAGE_UPLOAD_DIR, f"book-{book.id}.lock"
+    )
+
+
+@contextmanager
+def locked_upload(book):
+    """
+    Yields the lock file of the upload of the book, locked for this
+    request. A request that finds it locked is refused instead of
+    waiting for a slow client, and no database lock is held meanwhile
+    """
+    path = upload_lock_path(book)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "a+") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadInProgress()
+        # the upload was completed and its lock file deleted while this
+        # request waited for it
+        try:
+            current = os.stat(path).st_ino
+        except FileNotFoundError:
+            current = None
+        if current != os.fstat(lock_file.fileno()).st_ino:
+            raise UploadInProgress()
+        yield lock_file
+
+
+def check_declared_total(lock_file, content_range):
+    """
+    The first chunk stores the total size of the upload, a later chunk
+    that declares another one is refused
+    """
+    lock_file.seek(0)
+    declared = lock_file.read()
+
+    if content_range.start == 0:
+        lock_file.truncate(0)
+        lock_file.write(str(content_range.total))
+        lock_file.flush()
+    elif declared and int(declared) != content_range.total:
+        raise UploadTotalMismatch(
+            f"The upload was started with a total of {declared} bytes."
+        )
+
+
+def received_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def hash_file(path, digest):
+    with open(path, "rb") as file:
+        while chunk := file.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+
+
+def write_chunk(path, stream, content_range, digest=None):
+    """
+    Appends the body to the partial file UPLOAD_CHUNK_SIZE bytes at a
+    time, so memory use doesn't grow with the file. A body cut short is
+    kept, the client resumes after the last byte that arrived
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    remaining = content_range.end - content_range.start + 1
+
+    with open(path, "wb" if content_range.start == 0 else "ab") as file:
+        while remaining and stream is not None:
+            chunk = stream.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            file.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            remaining -= len(chunk)
+
+
+def receive_image_chunk(book, stream, content_range, lock_file):
+    """
+    Stores one Content-Range chunk of a cover upload, lock_file comes
+    from locked_upload. The chunk that completes the file is hashed
+    while it is written, after the part that arrived in earlier requests
+    is hashed from disk
+    """
+    path = partial_upload_path(book)
+    received = received_size(path)
+
+    if content_range.start not in (None, 0, received):
+        raise UploadOffsetMismatch(
+            f"Expected the chunk starting at byte {received}."
+        )
+    check_declared_total(lock_file, content_range)
+    if content_range.start is None:
+        return UploadProgress(received, content_range.total, None)
+
+    digest = None
+    if content_range.end == content_range.total - 1:
+        digest = hashlib.sha256()
+        if content_range.start:
+            hash_file(path, digest)
+
+    write_chunk(path, stream, content_range, digest)
+
+    received = received_size(path)
+    if received < content_range.total:
+        return UploadProgress(received, content_range.total, None)
+    return UploadProgress(received, content_range.total, digest.hexdigest())
+
+
+def discard_partial_upload(book):
+    for path in (partial_upload_path(book), upload_lock_path(book)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def store_uploaded_image(book):
+    """
+    Moves the completed upload into the cover of the book, call it with
+    the upload still locked
+    """
+    path = partial_upload_path(book)
+    try:
+        with Image.open(path) as image:
+            image.verify()
+            extension = image.format.lower()
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        discard_partial_upload(book)
+        raise ValidationError(
+            {"image": "Upload a valid image. The file you uploaded was "
+                      "either not an image or a corrupted image."}
+        )
+
+    with open(path, "rb") as file:
+        book.image.save(f"cover.{extension}", File(file), save=False)
+    book.image_variants = {}
+    book.save(update_fields=["image", "image_variants"])
+    discard_partial_upload(book)
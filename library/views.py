@@ -1,28 +1,143 @@
-from drf_spectacular.utils import extend_schema, OpenApiExample
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from drf_spectacular.utils import (
+    extend_schema,
+    OpenApiExample,
+    OpenApiParameter,
+)
 from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAdminUser
+
+from borrowing.models import Borrowing
+from borrowing.pagination import KeysetCursorPagination
+from borrowing.serializers import BookBorrowingSerializer
+from library.bulk import (
+    FILE_FORMATS,
+    export_books,
+    get_file_format,
+    import_books,
+)
+from library.cache_helper import (
+    get_cached_catalogue,
+    get_catalogue_etag,
+    set_cached_catalogue,
+)
 from library.models import Book
 from library.permissions import IsAdminOrReadOnly
+from library.search import search_books
+from library.tasks import process_book_image
+from library.uploads import (
+    locked_upload,
+    parse_content_range,
+    receive_image_chunk,
+    store_uploaded_image,
+)
 from library.serializers import (
     BookSerializer,
+    BookListSerializer,
     BookDetailSerializer,
     BookImageSerializer,
+    BookInventorySerializer,
+    BookImportSerializer,
 )
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import viewsets, status
 
 
+class BookListPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class BookBorrowingPagination(KeysetCursorPagination):
+    ordering = ("-borrow_date", "-id")
+
+
 class BookViewSet(viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = BookListPagination
+
+    def get_requested_fields(self):
+        """Validated ?fields= of the list, None means all fields"""
+        fields = self.request.query_params.get("fields")
+        if not fields:
+            return None
+
+        fields = tuple(
+            field.strip() for field in fields.split(",") if field.strip()
+        )
+        unknown = set(fields) - set(BookListSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError(
+                {
+                    "fields": f"Unknown fields: {', '.join(sorted(unknown))}. "
+                    f"Choose from: {', '.join(BookListSerializer.Meta.fields)}"
+                }
+            )
+        return fields
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if self.action != "list":
+            return queryset
+
+        search = self.request.query_params.get("search", "").strip()
+        if search:
+            queryset = search_books(queryset, search)
+        else:
+            queryset = queryset.order_by("id")
+
+        fields = self.get_requested_fields()
+        if fields:
+            queryset = queryset.only(*fields)
+
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == "list":
+            kwargs["fields"] = self.get_requested_fields()
+        return super().get_serializer(*args, **kwargs)
+
+    @staticmethod
+    def process_image_later(book):
+        """Renders the cover variants once the new cover is committed"""
+        if book.image:
+            transaction.on_commit(
+                lambda: process_book_image.delay(book.id), robust=True
+            )
+
+    def perform_create(self, serializer):
+        self.process_image_later(serializer.save())
+
+    def perform_update(self, serializer):
+        if "image" not in serializer.validated_data:
+            serializer.save()
+            return
+        # the variants of the replaced cover are dropped right away
+        self.process_image_later(serializer.save(image_variants={}))
 
     def get_serializer_class(self):
+        if self.action == "borrowings":
+            return BookBorrowingSerializer
+        if self.action == "list":
+            return BookListSerializer
         if self.action == "retrieve":
             return BookDetailSerializer
         if self.action == "upload_image":
             return BookImageSerializer
+        if self.action == "update_inventory":
+            return BookInventorySerializer
+        if self.action == "bulk":
+            return BookImportSerializer
         return BookSerializer
 
     @extend_schema(
@@ -73,16 +188,207 @@ class BookViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(book, data=request.data)
 
         if serializer.is_valid(raise_exception=True):
-            serializer.save()
+            self.process_image_later(serializer.save(image_variants={}))
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @extend_schema(
-        description="Get all books in our library (For all)",
+        description="Upload a cover in chunks, each sent with a "
+        "Content-Range: bytes <start>-<end>/<total> header. Returns 202 "
+        "with the received byte count until the last chunk arrives. "
+        "Send Content-Range: bytes */<total> without a body to ask where "
+        "to resume, and start at byte 0 again to restart. A chunk with "
+        "another <total> than the first one, or sent while another chunk "
+        "is being received, gets 409 (For admin)",
+        request={
+            "application/octet-stream": {"type": "string", "format": "binary"}
+        },
+    )
+    @action(
+        methods=["PUT"],
+        detail=True,
+        url_path="upload-image/chunked",
+        permission_classes=[IsAdminUser],
+        parser_classes=[],
+    )
+    def upload_image_chunk(self, request, pk=None):
+        """
+        Streams the body to disk instead of parsing it, request.data
+        must not be touched here
+        """
+        content_range = parse_content_range(
+            request.headers.get("Content-Range")
+        )
+        book = self.get_object()
+
+        # one request per book at a time appends to its upload, a file
+        # lock keeps the database out of the slow part
+        with locked_upload(book) as lock_file:
+            progress = receive_image_chunk(
+                book, request.stream, content_range, lock_file
+            )
+            if progress.sha256 is None:
+                response = Response(
+                    {"received": progress.received, "total": progress.total},
+                    status=status.HTTP_202_ACCEPTED,
+                )
+                if progress.received:
+                    response["Range"] = f"bytes=0-{progress.received - 1}"
+                return response
+
+            store_uploaded_image(book)
+        self.process_image_later(book)
+
+        data = BookImageSerializer(
+            book, context=self.get_serializer_context()
+        ).data
+        return Response(
+            {**data, "sha256": progress.sha256}, status=status.HTTP_200_OK
+        )
+
+    @extend_schema(
+        description="Set the number of available copies of a book "
+        "(For admin)",
+        examples=[
+            OpenApiExample("Set inventory", value={"inventory": 5}),
+        ],
+    )
+    @action(
+        methods=["PATCH"],
+        detail=True,
+        url_path="inventory",
+        permission_classes=[IsAdminUser],
+    )
+    def update_inventory(self, request, pk=None):
+        """Saves only the inventory column without full validation"""
+        book = self.get_object()
+        serializer = self.get_serializer(book, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        methods=["GET"],
+        description="Export all books as CSV or JSON Lines, in the "
+        "format the import accepts (For admin)",
+        parameters=[
+            OpenApiParameter(
+                "file_format",
+                type=str,
+                enum=list(FILE_FORMATS),
+                description="Export format (default csv)",
+            ),
+        ],
+        responses={(200, "text/csv"): str, (200, "application/x-ndjson"): str},
+    )
+    @extend_schema(
+        methods=["POST"],
+        description="Import books from a CSV or JSON Lines file with "
+        "the columns title, author, cover, inventory and daily. A book "
+        "with the same title and author is updated, otherwise a new one "
+        "is created. Nothing is saved if any row is invalid (For admin)",
+        parameters=[
+            OpenApiParameter(
+                "file_format",
+                type=str,
+                enum=list(FILE_FORMATS),
+                description="Import format, taken from the file "
+                            "extension if not set",
+            ),
+        ],
+        request={
+            "multipart/form-data": {
+                "type": "object",
+                "properties": {"file": {"type": "string", "format": "binary"}},
+            }
+        },
+    )
+    @action(
+        methods=["GET", "POST"],
+        detail=False,
+        url_path="bulk",
+        permission_classes=[IsAdminUser],
+        parser_classes=[MultiPartParser],
+    )
+    def bulk(self, request):
+        file_format = request.query_params.get("file_format")
+
+        if request.method == "GET":
+            file_format = get_file_format(file_format or "csv")
+            response = StreamingHttpResponse(
+                export_books(file_format),
+                content_type=FILE_FORMATS[file_format],
+            )
+            response["Content-Disposition"] = (
+                f'attachment; filename="books.{file_format}"'
+            )
+            return response
+
+        upload = request.FILES.get("file")
+        if upload is None:
+            raise ValidationError({"file": "No file was submitted."})
+
+        result = import_books(
+            upload, get_file_format(file_format, upload.name)
+        )
+        return Response(result, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        description="Get the borrowings of a book, newest first "
+        "(For admin)",
+    )
+    @action(
+        methods=["GET"],
+        detail=True,
+        url_path="borrowings",
+        permission_classes=[IsAdminUser],
+        pagination_class=BookBorrowingPagination,
+    )
+    def borrowings(self, request, pk=None):
+        book = self.get_object()
+        queryset = (
+            Borrowing.objects.filter(book=book)
+            .select_related("user")
+            .only(
+                "id",
+                "borrow_date",
+                "expected_return_date",
+                "actual_return_date",
+                "user__email",
+            )
+        )
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        description="Get all books in our library (For all). "
+        "Send the ETag in If-None-Match to get 304 while the catalogue "
+        "is unchanged",
+        parameters=[
+            OpenApiParameter(
+                "search",
+                type=str,
+                description="Search by title and author, the best "
+                            "matches come first (ex. ?search=dark tower)",
+            ),
+            OpenApiParameter(
+                "fields",
+                type=str,
+                description="Return only these comma-separated fields "
+                            "(ex. ?fields=id,title,inventory)",
+            ),
+        ],
     )
+    @method_decorator(condition(etag_func=get_catalogue_etag))
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        data = get_cached_catalogue(request)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            set_cached_catalogue(request, data)
+        return Response(data)
 
     @extend_schema(
         description="Get book by id (For all)",
@@ -22,6 +22,22 @@ from dotenv import load_dotenv
 load_dotenv()
 
 STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
+STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET", "")
+# payment.gateways.FakeGateway runs without Stripe, see payment.gateways
+PAYMENT_GATEWAY = {
+    "BACKEND": os.environ.get(
+        "PAYMENT_GATEWAY", "payment.gateways.StripeGateway"
+    ),
+    "OPTIONS": {},
+}
+# Public address of the site, for links sent without a request to take
+# the host from (reopened checkout sessions, the overdue digest)
+CHECKOUT_BASE_URL = os.environ.get(
+    "CHECKOUT_BASE_URL", "http://127.0.0.1:8000/"
+)
+# Seconds a payment may wait for its checkout session before it is
+# queued again
+CHECKOUT_RECOVERY_DELAY = 10 * 60
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -52,6 +68,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework_simplejwt",
     "drf_spectacular",
@@ -61,6 +78,7 @@ INSTALLED_APPS = [
     "payment",
     "django_celery_beat",
     "notifications",
+    "shortener",
 ]
 
 MIDDLEWARE = [
@@ -143,6 +161,10 @@ STATIC_URL = "static/"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = "/vol/web/media"
 
+# Chunked cover uploads are assembled here, outside the served media
+BOOK_IMAGE_UPLOAD_DIR = "/vol/web/uploads"
+BOOK_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -185,6 +207,23 @@ SPECTACULAR_SETTINGS = {
     },
 }
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"{REDIS_URL}/1",
+        "KEY_PREFIX": "library",
+    }
+}
+
+# Catalogue responses are cached per version, see library.cache_helper
+CATALOGUE_CACHE_TIMEOUT = 60 * 60
+# Borrowing counts on the book detail, overdue ones change with the date
+BOOK_STATS_CACHE_TIMEOUT = 5 * 60
+# Outstanding payments report of payment.ledger, it isn't invalidated
+OUTSTANDING_CACHE_TIMEOUT = 60
+
 CELERY_BROKER_URL = "redis://redis:6379"
 CELERY_RESULT_BACKEND = "redis://redis:6379"
 CELERY_TIMEZONE = "Europe/Kiev"
@@ -193,6 +232,28 @@ CELERY_BEAT_SCHEDULE = {
         "task": "borrowing.tasks.borrowing_books",
         "schedule": crontab(hour=12, minute=0),
     },
+    "drain-notification-outbox": {
+        "task": "notifications.tasks.drain_outbox",
+        "schedule": crontab(minute="*"),
+    },
+    "reopen-checkout-sessions": {
+        "task": "payment.tasks.reopen_checkout_sessions",
+        "schedule": crontab(minute="*/5"),
+    },
 }
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
+
+# Number of borrowings loaded per query by the daily overdue sweep
+OVERDUE_SWEEP_CHUNK_SIZE = 500
+# Number of overdue borrowings handled by one notification worker task
+OVERDUE_SHARD_SIZE = 200
+# Borrowings with the biggest fines listed in the admin overdue digest
+OVERDUE_DIGEST_SIZE = 20
+
+# Notification outbox drained by notifications.tasks.drain_outbox
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+# Seconds after which a claimed message counts as lost by its worker, it
+# has to cover the slowest batch (admin group messages go at 20/min)
+OUTBOX_CLAIM_TIMEOUT = 15 * 60
@@ -0,0 +1,24 @@
+from django.test import TestCase as DjangoTestCase
+from django.test import TransactionTestCase as DjangoTransactionTestCase
+from django.test import override_settings
+
+# Test databases are rolled back after every test but a shared cache is
+# not, so tests run without one whichever runner starts them. Tests that
+# need a cache switch to a local one themselves
+NO_CACHE = override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+        }
+    }
+)
+
+
+@NO_CACHE
+class TestCase(DjangoTestCase):
+    pass
+
+
+@NO_CACHE
+class TransactionTestCase(DjangoTransactionTestCase):
+    pass
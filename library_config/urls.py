@@ -31,6 +31,7 @@ urlpatterns = [
     path("api/borrowings/", include("borrowing.urls", namespace="borrowing")),
     path("api/books/", include("library.urls", namespace="library")),
     path("api/payments/", include("payment.urls", namespace="payment")),
+    path("s/", include("shortener.urls", namespace="shortener")),
     path("api/doc/", SpectacularAPIView.as_view(), name="schema"),
     path(
         "api/doc/swagger/",
@@ -0,0 +1,6 @@
+from django.contrib import admin
+
+from notifications.models import OutboxMessage
+
+
+admin.site.register(OutboxMessage)
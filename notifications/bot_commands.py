@@ -1,78 +1,45 @@
-import os
-from dotenv import load_dotenv
-
-from notifications.bot_utils import asyncio_run
-from notifications.management.commands.start_bot import send_message
-
-import pyshorteners
-
-load_dotenv()
-
-ADMIN_GROUP = int(os.getenv("ADMIN_GROUP", 0))
+from notifications.models import OutboxMessage
+from notifications.outbox import enqueue
+from notifications.telegram_client import ADMIN_GROUP
+from shortener.links import shorten
 
 PAYMENT_IMAGE_URL = "https://i.imgur.com/VWH0a9i.jpg"
 BORROWING_IMAGE_URL = "https://i.imgur.com/Yjf9ARQ.jpg"
 
 
-async def _send_payment_notification(
-        telegram_id,
-        message_to_user,
-        message_to_admin
-):
-    if telegram_id:
-        await send_message(
-            telegram_id=telegram_id,
-            message=message_to_user,
-            image=PAYMENT_IMAGE_URL
-
-        )
-    if ADMIN_GROUP:
-        await send_message(
-            telegram_id=ADMIN_GROUP,
-            message=message_to_admin,
-            image=PAYMENT_IMAGE_URL
-        )
-
-
-async def _send_overdue_notification(
-        telegram_id,
-        message
-):
-    await send_message(telegram_id, message=message)
-    if ADMIN_GROUP:
-        await send_message(
-            telegram_id=ADMIN_GROUP,
-            message="overdue"
-        )
-
-
-async def _send_borrowing_notification(
+def get_notification_messages(
         telegram_id,
         message_to_user,
         message_to_admin,
+        image,
 ):
+    messages = []
     if telegram_id:
-        await send_message(
-            telegram_id=telegram_id,
-            message=message_to_user,
-            image=BORROWING_IMAGE_URL
+        messages.append(
+            OutboxMessage(
+                chat_id=telegram_id,
+                text=message_to_user,
+                image=image,
+            )
         )
     if ADMIN_GROUP:
-        await send_message(
-            telegram_id=ADMIN_GROUP,
-            message=message_to_admin,
-            image=BORROWING_IMAGE_URL
+        messages.append(
+            OutboxMessage(
+                chat_id=ADMIN_GROUP,
+                text=message_to_admin,
+                image=image,
+            )
         )
+    return messages
 
 
-def send_borrowing_notification(user, borrowing):
-    payment_info = borrowing.payments.filter(status="PENDING").first()
-    long_session_url = payment_info.session_url
-
-    type_tiny = pyshorteners.Shortener()
-    short_session_url = type_tiny.tinyurl.short(long_session_url)
+def send_borrowing_notification(payment, base_url):
+    """Sent once the checkout session of the first payment exists"""
+    user = payment.user
+    borrowing = payment.borrowing
+    short_session_url = shorten(payment.session_url, base_url)
 
-    money = payment_info.money_to_pay
+    money = payment.money_to_pay
 
     telegram_id = None
     if user.telegram_notifications_enabled and user.telegram_id:
@@ -89,24 +56,16 @@ def send_borrowing_notification(user, borrowing):
         f"✉️ user {borrowing.user.email}."
         f"💰 Price: {money} $ "
     )
-    asyncio_run(
-        _send_borrowing_notification(
+    enqueue(
+        get_notification_messages(
             telegram_id,
             message_to_user,
             message_to_admin,
+            BORROWING_IMAGE_URL,
         )
     )
 
 
-def send_overdue_notification(
-        users: dict,
-) -> None:
-    for user in users:
-        asyncio_run(
-            _send_overdue_notification(user, users[user]["book"])
-        )
-
-
 def send_payment_notification(user, payment):
     telegram_id = None
     if user.telegram_notifications_enabled and user.telegram_id:
@@ -118,10 +77,39 @@ def send_payment_notification(user, payment):
     )
     message_to_admin = message_to_user + f" by user {payment.user.email}"
 
-    asyncio_run(
-        _send_payment_notification(
+    enqueue(
+        get_notification_messages(
             telegram_id,
-            message_to_user=message_to_user,
-            message_to_admin=message_to_admin,
+            message_to_user,
+            message_to_admin,
+            PAYMENT_IMAGE_URL,
+        )
+    )
+
+
+def send_refund_notification(payment):
+    """Sent when a payment arrives for a book that is out of stock"""
+    user = payment.user
+    telegram_id = None
+    if user.telegram_notifications_enabled and user.telegram_id:
+        telegram_id = user.telegram_id
+
+    message_to_user = (
+        f"💰 Your payment for 📕 {payment.borrowing.book.title} arrived, "
+        f"but the book is out of stock. "
+        f"{payment.money_to_pay} $ will be refunded."
+    )
+    message_to_admin = (
+        f"⚠️ Payment #{payment.id} by user {user.email} for "
+        f"📕 {payment.borrowing.book.title} was paid, but the book is out "
+        f"of stock. Refund {payment.money_to_pay} $."
+    )
+
+    enqueue(
+        get_notification_messages(
+            telegram_id,
+            message_to_user,
+            message_to_admin,
+            PAYMENT_IMAGE_URL,
         )
     )
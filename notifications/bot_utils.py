@@ -1,21 +1,38 @@
 import asyncio
+import os
 
 import threading
 from typing import Awaitable, TypeVar
 
 T = TypeVar("T")
 
+_LOOP = None
+_LOOP_PID = None
+_LOOP_LOCK = threading.Lock()
+
 
 def _start_background_loop(loop):
     asyncio.set_event_loop(loop)
     loop.run_forever()
 
 
-_LOOP = asyncio.new_event_loop()
-_LOOP_THREAD = threading.Thread(
-    target=_start_background_loop, args=(_LOOP,), daemon=True
-)
-_LOOP_THREAD.start()
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the event loop running on this process' background thread.
+    The loop is started lazily and again after a fork, since the thread
+    of the parent process does not survive in Celery prefork workers.
+    """
+    global _LOOP, _LOOP_PID
+
+    with _LOOP_LOCK:
+        if _LOOP is None or _LOOP_PID != os.getpid():
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(
+                target=_start_background_loop, args=(_LOOP,), daemon=True
+            ).start()
+            _LOOP_PID = os.getpid()
+
+    return _LOOP
 
 
 def asyncio_run(coro: Awaitable[T], timeout=30) -> T:
@@ -28,7 +45,7 @@ def asyncio_run(coro: Awaitable[T], timeout=30) -> T:
     :param timeout: How many seconds we should wait for a
     result before raising an error
     """
-    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result(
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(
         timeout=timeout
     )
 
@@ -43,4 +60,4 @@ def asyncio_gather(*futures, return_exceptions=False) -> list:
             *futures, return_exceptions=return_exceptions
         )
 
-    return asyncio.run_coroutine_threadsafe(gather(), loop=_LOOP).result()
+    return asyncio.run_coroutine_threadsafe(gather(), loop=get_loop()).result()
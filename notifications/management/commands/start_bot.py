@@ -2,7 +2,6 @@ import asyncio
 import os
 
 from aiogram import Bot, Dispatcher, types
-from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart
 from django.core.management import BaseCommand
 from dotenv import load_dotenv
@@ -21,25 +20,6 @@ bot = Bot(os.getenv("BOT_TOKEN"))
 dp = Dispatcher()
 
 
-async def send_message(
-        telegram_id: int,
-        message: str,
-        image: str = None
-):
-
-    if image:
-        await bot.send_photo(
-            chat_id=telegram_id,
-            photo=image,
-            caption=message
-        )
-    else:
-        await bot.send_message(
-            chat_id=telegram_id,
-            text=message,
-            parse_mode=ParseMode.MARKDOWN
-        )
-
 @dp.message(CommandStart())
 async def cmd_start(message: types.Message):
     parameter = obtain_token(message.text)
@@ -0,0 +1,35 @@
+from django.db import models
+from django.db.models import Q
+
+
+class OutboxMessage(models.Model):
+    STATUS_CHOICES = [
+        ("PENDING", "Pending"),
+        ("SENDING", "Sending"),
+        ("SENT", "Sent"),
+        ("FAILED", "Failed"),
+    ]
+
+    chat_id = models.BigIntegerField()
+    text = models.TextField()
+    image = models.URLField(blank=True)
+    status = models.CharField(
+        max_length=63, choices=STATUS_CHOICES, default="PENDING"
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # when a worker took the message for delivery, see drain_outbox
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=Q(status__in=["PENDING", "SENDING"]),
+                name="outbox_unsent_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Message #{self.id} to {self.chat_id} - {self.status}"
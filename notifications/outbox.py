@@ -0,0 +1,15 @@
+from django.db import transaction
+
+from notifications.models import OutboxMessage
+from notifications.tasks import drain_outbox
+
+
+def enqueue(messages):
+    """
+    Stores the messages in the outbox as part of the current transaction
+    and asks a worker to drain the outbox once the transaction commits.
+    """
+    messages = OutboxMessage.objects.bulk_create(messages)
+    if messages:
+        transaction.on_commit(drain_outbox.delay, robust=True)
+    return messages
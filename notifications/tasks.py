@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from notifications.models import OutboxMessage
+from notifications.telegram_client import TelegramMessage, deliver
+
+
+def to_telegram_message(message):
+    return TelegramMessage(
+        message.chat_id, message.text, message.image or None
+    )
+
+
+def claim_batch(last_id):
+    """
+    Marks the next batch of unsent messages SENDING and commits, so no
+    lock is held while they are delivered. Rows locked by another worker
+    are skipped, and a claim older than OUTBOX_CLAIM_TIMEOUT seconds is
+    taken over, its worker is assumed dead
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT)
+    unsent = Q(status="PENDING") | Q(status="SENDING", claimed_at__lt=stale)
+
+    with transaction.atomic():
+        batch = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(unsent, id__gt=last_id)
+            .order_by("id")[:settings.OUTBOX_BATCH_SIZE]
+        )
+        OutboxMessage.objects.filter(
+            id__in=[message.id for message in batch]
+        ).update(status="SENDING", claimed_at=now)
+
+    for message in batch:
+        message.claimed_at = now
+    return batch
+
+
+def record_delivery(batch, delivered):
+    """
+    Stores the outcome of a claimed batch. A message whose claim was
+    taken over in the meantime is left to the worker that took it
+    """
+    sent_ids = []
+    failed_ids = []
+    for message, ok in zip(batch, delivered):
+        (sent_ids if ok else failed_ids).append(message.id)
+
+    claim = Q(status="SENDING", claimed_at=batch[0].claimed_at)
+    with transaction.atomic():
+        sent = OutboxMessage.objects.filter(claim, id__in=sent_ids).update(
+            status="SENT",
+            attempts=F("attempts") + 1,
+            sent_at=timezone.now(),
+        )
+        OutboxMessage.objects.filter(claim, id__in=failed_ids).update(
+            status=Case(
+                When(
+                    attempts__gte=settings.OUTBOX_MAX_ATTEMPTS - 1,
+                    then=Value("FAILED"),
+                ),
+                default=Value("PENDING"),
+            ),
+            attempts=F("attempts") + 1,
+            claimed_at=None,
+        )
+    return sent
+
+
+@shared_task
+def drain_outbox():
+    """
+    Delivers unsent outbox messages in id order, one claimed batch at a
+    time. A message that keeps failing is marked FAILED after
+    OUTBOX_MAX_ATTEMPTS tries, one that failed now is retried by a later
+    run
+    """
+    last_id = 0
+    sent = 0
+
+    while batch := claim_batch(last_id):
+        delivered = deliver(to_telegram_message(m) for m in batch)
+        sent += record_delivery(batch, delivered)
+        last_id = batch[-1].id
+
+    return sent
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+from redis import asyncio as aioredis
+
+from notifications.bot_utils import asyncio_run
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ADMIN_GROUP = int(os.getenv("ADMIN_GROUP", 0))
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+
+# Telegram Bot API limits: about 30 messages per second in total,
+# one message per second to a single chat and 20 per minute to a group.
+# They hold for the bot, so get_client keeps the buckets in Redis where
+# all worker processes share them.
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+GROUP_RATE = 20 / 60
+# a client without Redis forgets the least recently used chat buckets
+MAX_CHAT_BUCKETS = 10000
+
+MAX_CONNECTIONS = 32
+MAX_CONCURRENCY = 30
+KEEPALIVE_TIMEOUT = 60
+REQUEST_TIMEOUT = 15
+MAX_RETRIES = 3
+
+# KEYS[1] is the bucket, ARGV its rate and capacity. Takes a token and
+# returns 0, or returns the seconds until the next one. The clock is the
+# one of Redis, and the key expires once the bucket would be full again.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "updated", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+@dataclass
+class TelegramMessage:
+    chat_id: int
+    text: str
+    image: Optional[str] = None
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate,
+                )
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RedisTokenBucket:
+    """
+    A TokenBucket kept in Redis, shared by every process that acquires
+    it under the same key
+    """
+
+    def __init__(self, script, key: str, rate: float, capacity: float = 1):
+        self.script = script
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+
+    async def acquire(self) -> None:
+        while True:
+            wait = float(
+                await self.script(
+                    keys=[self.key], args=[self.rate, self.capacity]
+                )
+            )
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class TelegramClient:
+    """
+    Bot API client sharing one keep-alive connection pool between all
+    sends. Concurrency is bounded by a semaphore and every request waits
+    for both the global and the per-chat token bucket. The buckets are
+    kept in redis if one is given, otherwise in this process only.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        max_connections: int = MAX_CONNECTIONS,
+        max_concurrency: int = MAX_CONCURRENCY,
+        redis: Optional[aioredis.Redis] = None,
+    ):
+        self.base_url = f"{TELEGRAM_API_URL}/bot{token}"
+        self.max_connections = max_connections
+        self._session = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._redis = redis
+        self._bucket_script = None
+        if redis is not None:
+            self._bucket_script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        # the limits belong to the bot, the part of the token before ":"
+        self._bucket_prefix = f"telegram:{str(token).split(':')[0]}"
+        self._global_bucket = self._make_bucket(
+            "global", GLOBAL_RATE, GLOBAL_RATE
+        )
+        self._chat_buckets = OrderedDict()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            )
+        return self._session
+
+    def _make_bucket(self, name: str, rate: float, capacity: float = 1):
+        if self._bucket_script is not None:
+            return RedisTokenBucket(
+                self._bucket_script,
+                f"{self._bucket_prefix}:{name}",
+                rate,
+                capacity,
+            )
+        return TokenBucket(rate, capacity)
+
+    def _get_chat_bucket(self, chat_id: int):
+        rate = GROUP_RATE if int(chat_id) < 0 else CHAT_RATE
+        if self._bucket_script is not None:
+            # Redis expires the keys, nothing is kept here
+            return self._make_bucket(f"chat:{chat_id}", rate)
+
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate)
+            if len(self._chat_buckets) > MAX_CHAT_BUCKETS:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _post(self, method: str, payload: dict) -> tuple:
+        session = self._get_session()
+        async with session.post(
+            f"{self.base_url}/{method}", json=payload
+        ) as response:
+            return response.status, await response.json()
+
+    async def _call(self, method: str, payload: dict) -> bool:
+        await self._get_chat_bucket(payload["chat_id"]).acquire()
+
+        async with self._semaphore:
+            for _ in range(MAX_RETRIES):
+                await self._global_bucket.acquire()
+                status, data = await self._post(method, payload)
+
+                if status == 429:
+                    retry_after = data.get("parameters", {}).get(
+                        "retry_after", 1
+                    )
+                    await asyncio.sleep(retry_after)
+                    continue
+
+                if not data.get("ok"):
+                    logger.warning(
+                        "Telegram %s to %s failed: %s",
+                        method,
+                        payload["chat_id"],
+                        data.get("description"),
+                    )
+                return bool(data.get("ok"))
+
+        return False
+
+    async def send(self, message: TelegramMessage) -> bool:
+        if message.image:
+            return await self._call(
+                "sendPhoto",
+                {
+                    "chat_id": message.chat_id,
+                    "photo": message.image,
+                    "caption": message.text,
+                },
+            )
+        return await self._call(
+            "sendMessage",
+            {"chat_id": message.chat_id, "text": message.text},
+        )
+
+    async def send_many(
+        self, messages: Iterable[TelegramMessage]
+    ) -> List[bool]:
+        results = await asyncio.gather(
+            *(self.send(message) for message in messages),
+            return_exceptions=True,
+        )
+        delivered = []
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning("Telegram delivery failed: %r", result)
+                result = False
+            delivered.append(result)
+        return delivered
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+        if self._redis is not None:
+            await self._redis.aclose()
+
+
+_CLIENT = None
+_CLIENT_PID = None
+
+
+def get_client() -> TelegramClient:
+    global _CLIENT, _CLIENT_PID
+
+    if _CLIENT is None or _CLIENT_PID != os.getpid():
+        _CLIENT = TelegramClient(
+            os.getenv("BOT_TOKEN"), redis=aioredis.from_url(REDIS_URL)
+        )
+        _CLIENT_PID = os.getpid()
+    return _CLIENT
+
+
+def deliver(messages: Iterable[TelegramMessage]) -> List[bool]:
+    """
+    Sends the messages concurrently through the shared client and blocks
+    until all of them are delivered or failed.
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+    return asyncio_run(get_client().send_many(messages), timeout=None)
@@ -0,0 +1,226 @@
+import asyncio
+import time
+from datetime import timedelta
+from unittest import mock
+
+import aiohttp
+from django.db import connection
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from library_config.testing import TestCase, TransactionTestCase
+from notifications.models import OutboxMessage
+from notifications.outbox import enqueue
+from notifications.tasks import drain_outbox
+from notifications.telegram_client import (
+    RedisTokenBucket,
+    TelegramClient,
+    TelegramMessage,
+    TokenBucket,
+)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_acquire_is_rate_limited(self):
+        async def acquire_many():
+            bucket = TokenBucket(rate=50)
+            started = time.monotonic()
+            for _ in range(6):
+                await bucket.acquire()
+            return time.monotonic() - started
+
+        # the first token is free, the next five wait 20 ms each
+        self.assertGreaterEqual(asyncio.run(acquire_many()), 0.09)
+
+    def test_redis_bucket_waits_as_long_as_redis_says(self):
+        script = mock.AsyncMock(side_effect=[b"0.01", b"0"])
+        bucket = RedisTokenBucket(script, "telegram:1:global", 30, 30)
+
+        with mock.patch("asyncio.sleep") as sleep:
+            asyncio.run(bucket.acquire())
+
+        sleep.assert_awaited_once_with(0.01)
+        self.assertEqual(
+            script.await_args.kwargs,
+            {"keys": ["telegram:1:global"], "args": [30, 30]},
+        )
+
+
+class TelegramClientTests(SimpleTestCase):
+    def setUp(self):
+        self.client = TelegramClient("123:token")
+
+    def test_buckets_are_shared_through_redis(self):
+        redis = mock.Mock()
+        client = TelegramClient("123:token", redis=redis)
+
+        bucket = client._get_chat_bucket(-5)
+
+        self.assertIsInstance(client._global_bucket, RedisTokenBucket)
+        self.assertEqual(bucket.key, "telegram:123:chat:-5")
+        self.assertIs(bucket.script, redis.register_script.return_value)
+        self.assertFalse(client._chat_buckets)
+
+    @mock.patch("notifications.telegram_client.MAX_CHAT_BUCKETS", 2)
+    def test_local_chat_buckets_are_bounded(self):
+        for chat_id in (1, 2, 1, 3):
+            self.client._get_chat_bucket(chat_id)
+
+        self.assertEqual(list(self.client._chat_buckets), [1, 3])
+
+    def test_send_many_uses_photo_and_message_methods(self):
+        self.client._post = mock.AsyncMock(return_value=(200, {"ok": True}))
+
+        delivered = asyncio.run(
+            self.client.send_many(
+                [
+                    TelegramMessage(1, "text"),
+                    TelegramMessage(2, "caption", "https://img"),
+                ]
+            )
+        )
+
+        self.assertEqual(delivered, [True, True])
+        methods = {call.args[0] for call in self.client._post.await_args_list}
+        self.assertEqual(methods, {"sendMessage", "sendPhoto"})
+
+    def test_send_retries_after_flood_limit(self):
+        self.client._post = mock.AsyncMock(
+            side_effect=[
+                (429, {"ok": False, "parameters": {"retry_after": 0}}),
+                (200, {"ok": True}),
+            ]
+        )
+
+        delivered = asyncio.run(
+            self.client.send_many([TelegramMessage(1, "text")])
+        )
+
+        self.assertEqual(delivered, [True])
+        self.assertEqual(self.client._post.await_count, 2)
+
+    def test_send_many_reports_failed_messages(self):
+        self.client._post = mock.AsyncMock(
+            side_effect=aiohttp.ClientError("boom")
+        )
+
+        delivered = asyncio.run(
+            self.client.send_many([TelegramMessage(1, "text")])
+        )
+
+        self.assertEqual(delivered, [False])
+
+
+class OutboxTestMixin:
+    def setUp(self):
+        self.delivered = []
+        self.results = []
+        patcher = mock.patch(
+            "notifications.tasks.deliver", side_effect=self.deliver
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def deliver(self, messages):
+        messages = list(messages)
+        self.delivered.extend(messages)
+        return [self.results.pop(0) for _ in messages]
+
+
+class OutboxTests(OutboxTestMixin, TestCase):
+    def test_enqueue_drains_only_after_commit(self):
+        with mock.patch("notifications.outbox.drain_outbox") as drain:
+            with self.captureOnCommitCallbacks() as callbacks:
+                enqueue([OutboxMessage(chat_id=1, text="hello")])
+                drain.delay.assert_not_called()
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(OutboxMessage.objects.get().status, "PENDING")
+
+    def test_drain_marks_delivered_messages_sent(self):
+        OutboxMessage.objects.create(
+            chat_id=1, text="hello", image="https://img"
+        )
+        OutboxMessage.objects.create(chat_id=2, text="admin")
+        self.results = [True, True]
+
+        sent = drain_outbox()
+
+        self.assertEqual(sent, 2)
+        self.assertEqual(self.delivered[0].image, "https://img")
+        self.assertIsNone(self.delivered[1].image)
+        self.assertFalse(
+            OutboxMessage.objects.exclude(status="SENT").exists()
+        )
+
+    def test_drain_retries_then_gives_up(self):
+        message = OutboxMessage.objects.create(chat_id=1, text="hello")
+
+        with self.settings(OUTBOX_MAX_ATTEMPTS=2):
+            self.results = [False]
+            drain_outbox()
+            message.refresh_from_db()
+            self.assertEqual(
+                (message.status, message.attempts), ("PENDING", 1)
+            )
+
+            self.results = [False]
+            drain_outbox()
+            message.refresh_from_db()
+            self.assertEqual(
+                (message.status, message.attempts), ("FAILED", 2)
+            )
+
+    def test_drain_claims_messages_before_delivery(self):
+        OutboxMessage.objects.create(chat_id=1, text="hello")
+        self.results = [True]
+        statuses = []
+
+        def deliver(messages):
+            statuses.extend(
+                OutboxMessage.objects.values_list("status", flat=True)
+            )
+            return self.deliver(messages)
+
+        with mock.patch("notifications.tasks.deliver", side_effect=deliver):
+            drain_outbox()
+
+        self.assertEqual(statuses, ["SENDING"])
+        self.assertEqual(OutboxMessage.objects.get().status, "SENT")
+
+    def test_drain_takes_over_stale_claims(self):
+        now = timezone.now()
+        OutboxMessage.objects.create(
+            chat_id=1,
+            text="lost",
+            status="SENDING",
+            claimed_at=now - timedelta(hours=1),
+        )
+        OutboxMessage.objects.create(
+            chat_id=2, text="in flight", status="SENDING", claimed_at=now
+        )
+        self.results = [True]
+
+        self.assertEqual(drain_outbox(), 1)
+
+        self.assertEqual([m.text for m in self.delivered], ["lost"])
+        self.assertEqual(
+            OutboxMessage.objects.get(text="in flight").status, "SENDING"
+        )
+
+
+class OutboxTransactionTests(OutboxTestMixin, TransactionTestCase):
+    def test_delivery_runs_outside_a_transaction(self):
+        OutboxMessage.objects.create(chat_id=1, text="hello")
+        self.results = [True]
+        in_transaction = []
+
+        def deliver(messages):
+            in_transaction.append(connection.in_atomic_block)
+            return self.deliver(messages)
+
+        with mock.patch("notifications.tasks.deliver", side_effect=deliver):
+            drain_outbox()
+
+        self.assertEqual(in_transaction, [False])
+        self.assertEqual(OutboxMessage.objects.get().status, "SENT")
@@ -2,4 +2,9 @@ from django.contrib import admin
 
 from payment.models import Payment
 
-admin.site.register(Payment)
+
+@admin.register(Payment)
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "type", "status", "money_to_pay")
+    list_filter = ("status", "type")
+    list_select_related = ("user",)
@@ -0,0 +1,48 @@
+from django.db import transaction
+
+from payment.models import Payment
+from payment.pricing import fine_price, overdue_days, start_price
+from payment.tasks import checkout_urls, open_checkout_session
+
+
+def create_payment(borrowing, success_url, cancel_url):
+    """
+    A pending payment without a checkout session yet, the price and the
+    checkout URLs are fixed here and the session is created for it by
+    payment.tasks. A book returned late gets its fine, any other the
+    start price
+    """
+    if borrowing.actual_return_date and overdue_days(borrowing):
+        payment_type, money_to_pay = "FINE", fine_price(borrowing)
+    else:
+        payment_type, money_to_pay = "PAYMENT", start_price(borrowing)
+
+    return Payment.objects.create(
+        status="PENDING",
+        type=payment_type,
+        borrowing=borrowing,
+        user=borrowing.user,
+        money_to_pay=money_to_pay,
+        success_url=success_url,
+        cancel_url=cancel_url,
+    )
+
+
+def start_checkout(borrowing, request):
+    """
+    Creates the pending payment of the borrowing and asks a worker to
+    open its Stripe checkout session once the transaction commits, so
+    no transaction waits for Stripe. Until then the session_url of the
+    payment is empty, the client polls the payment for it. If the task
+    is lost, payment.tasks.reopen_checkout_sessions queues it again
+    """
+    base_url = request.build_absolute_uri("/")
+    payment = create_payment(
+        borrowing, *checkout_urls(borrowing.id, base_url)
+    )
+
+    transaction.on_commit(
+        lambda: open_checkout_session.delay(payment.id, base_url),
+        robust=True,
+    )
+    return payment
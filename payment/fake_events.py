@@ -0,0 +1,40 @@
+import hashlib
+import hmac
+import json
+import time
+import uuid
+
+
+def checkout_session_completed(session_id):
+    """The part of a Stripe checkout.session.completed event we read"""
+    return {
+        "id": f"evt_{uuid.uuid4().hex}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "created": int(time.time()),
+        "data": {
+            "object": {
+                "id": session_id,
+                "object": "checkout.session",
+                "payment_status": "paid",
+                "status": "complete",
+            }
+        },
+    }
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """A Stripe-Signature header for the payload, as Stripe signs it"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(
+        secret.encode(),
+        f"{timestamp}.{payload}".encode(),
+        hashlib.sha256,
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def signed_event(event, secret):
+    """Returns the body and the Stripe-Signature header of an event"""
+    payload = json.dumps(event)
+    return payload, sign_payload(payload, secret)
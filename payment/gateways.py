@@ -0,0 +1,114 @@
+import json
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from functools import lru_cache
+
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+CheckoutSession = namedtuple("CheckoutSession", ("id", "url"))
+
+
+class GatewayUnavailable(Exception):
+    """A failure worth retrying, the gateway may work a moment later"""
+
+
+class GatewayError(Exception):
+    """The gateway refused the payment, a retry would fail the same way"""
+
+
+class PaymentGateway(ABC):
+    """Creates the checkout sessions a user pays a payment through"""
+
+    def __init__(self, **options):
+        self.options = options
+
+    @abstractmethod
+    def create_checkout_session(self, payment, success_url, cancel_url):
+        """
+        Returns the CheckoutSession of the payment. Calling it again for
+        the same payment must return the same session
+        """
+
+
+class StripeGateway(PaymentGateway):
+    # errors of the connection or of Stripe itself, not of the request
+    TRANSIENT_ERRORS = (
+        stripe.error.APIConnectionError,
+        stripe.error.APIError,
+        stripe.error.RateLimitError,
+    )
+
+    def create_checkout_session(self, payment, success_url, cancel_url):
+        try:
+            session = stripe.checkout.Session.create(
+                api_key=settings.STRIPE_SECRET_KEY,
+                # a retry gets the session created for the payment back
+                idempotency_key=f"payment-{payment.id}",
+                payment_method_types=["card"],
+                line_items=[{
+                    "price_data": {
+                        "currency": "usd",
+                        "unit_amount": int(payment.money_to_pay * 100),
+                        "product_data": {
+                            "name": payment.borrowing.book.title,
+                            "description": f"User: {payment.user.email}",
+                        },
+                    },
+                    "quantity": 1,
+                }],
+                mode="payment",
+                success_url=success_url,
+                cancel_url=cancel_url,
+            )
+        except self.TRANSIENT_ERRORS as error:
+            raise GatewayUnavailable(str(error)) from error
+        except stripe.error.StripeError as error:
+            raise GatewayError(str(error)) from error
+        return CheckoutSession(session.id, session.url)
+
+
+class FakeGateway(PaymentGateway):
+    """
+    Runs in the process, for tests and offline load tests. Sessions are
+    named after the payment and nothing is kept between calls, latency
+    (seconds) delays every call and failure_rate of the calls raise
+    GatewayUnavailable, drawn from a generator seeded with seed
+    """
+
+    def __init__(self, latency=0, failure_rate=0, seed=0, **options):
+        super().__init__(**options)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+    def create_checkout_session(self, payment, success_url, cancel_url):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.random.random() < self.failure_rate:
+            raise GatewayUnavailable("Fake gateway failure")
+
+        session_id = f"cs_fake_{payment.id}"
+        return CheckoutSession(
+            session_id, f"https://checkout.fake/pay/{session_id}"
+        )
+
+
+@lru_cache(maxsize=None)
+def load_gateway(backend, options):
+    return import_string(backend)(**json.loads(options))
+
+
+def get_gateway():
+    """
+    The gateway of the PAYMENT_GATEWAY setting, one instance per
+    configuration
+    """
+    config = settings.PAYMENT_GATEWAY
+    return load_gateway(
+        config["BACKEND"],
+        json.dumps(config.get("OPTIONS", {}), sort_keys=True),
+    )
@@ -0,0 +1,123 @@
+from decimal import Decimal
+from itertools import chain
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, DateField, F, Sum, When
+from django.utils import timezone
+
+from borrowing.overdue_sweep import overdue_borrowings
+from payment.models import Payment
+from payment.pricing import with_prices
+
+# group -> (plain fields, computed fields) of pending payments and of
+# overdue borrowings, with the same names in both
+PAYMENT_GROUPS = {
+    "user": (("user_id",), {"email": F("user__email")}),
+    "book": (
+        (),
+        {
+            "book_id": F("borrowing__book_id"),
+            "title": F("borrowing__book__title"),
+        },
+    ),
+    # the day the money fell due
+    "day": (
+        (),
+        {
+            "day": Case(
+                When(type="FINE", then=F("borrowing__actual_return_date")),
+                default=F("borrowing__borrow_date"),
+                output_field=DateField(),
+            )
+        },
+    ),
+}
+BORROWING_GROUPS = {
+    "user": (("user_id",), {"email": F("user__email")}),
+    "book": (("book_id",), {"title": F("book__title")}),
+    "day": ((), {"day": F("expected_return_date")}),
+}
+GROUPS = tuple(PAYMENT_GROUPS)
+
+ZERO = Decimal("0.00")
+
+
+def pending_by(group_by):
+    fields, expressions = PAYMENT_GROUPS[group_by]
+    return (
+        Payment.objects.filter(status="PENDING")
+        .values(*fields, **expressions)
+        .annotate(pending=Sum("money_to_pay"), pending_payments=Count("id"))
+        .order_by()
+    )
+
+
+def accrued_fines_by(group_by, today):
+    """Fines of books not returned yet, no payment exists for them"""
+    fields, expressions = BORROWING_GROUPS[group_by]
+    return (
+        with_prices(overdue_borrowings(today), today)
+        .values(*fields, **expressions)
+        .annotate(
+            accrued_fines=Sum("fine_price"), overdue_borrowings=Count("id")
+        )
+        .order_by()
+    )
+
+
+def outstanding(group_by, today=None):
+    """
+    Money owed to the library per group: pending payments plus fines
+    accrued on overdue borrowings. Each part is one aggregate query,
+    only their grouped rows are merged here
+    """
+    today = today or timezone.localdate()
+    fields, expressions = PAYMENT_GROUPS[group_by]
+    key_names = (*fields, *expressions)
+
+    rows = {}
+    for row in chain(pending_by(group_by), accrued_fines_by(group_by, today)):
+        entry = rows.setdefault(
+            tuple(row[name] for name in key_names),
+            {
+                **{name: row[name] for name in key_names},
+                "pending": ZERO,
+                "pending_payments": 0,
+                "accrued_fines": ZERO,
+                "overdue_borrowings": 0,
+            },
+        )
+        entry.update(
+            (name, value)
+            for name, value in row.items()
+            if name not in key_names
+        )
+
+    results = []
+    for entry in rows.values():
+        entry["total"] = entry["pending"] + entry["accrued_fines"]
+        results.append(entry)
+    results.sort(key=lambda entry: entry["total"], reverse=True)
+
+    return {
+        "group_by": group_by,
+        "as_of": today,
+        "totals": {
+            name: sum((entry[name] for entry in results), ZERO)
+            for name in ("pending", "accrued_fines", "total")
+        },
+        "results": results,
+    }
+
+
+def get_outstanding(group_by):
+    """outstanding() of today, cached for OUTSTANDING_CACHE_TIMEOUT"""
+    today = timezone.localdate()
+    key = f"payments:outstanding:{group_by}:{today.isoformat()}"
+
+    data = cache.get(key)
+    if data is None:
+        data = outstanding(group_by, today)
+        cache.set(key, data, timeout=settings.OUTSTANDING_CACHE_TIMEOUT)
+    return data
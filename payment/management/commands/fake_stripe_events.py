@@ -0,0 +1,89 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from payment.fake_events import checkout_session_completed, signed_event
+from payment.models import Payment
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends signed checkout.session.completed events for pending "
+        "payments to the Stripe webhook, to load-test it without Stripe"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", default="http://localhost:8000/api/payments/webhook/"
+        )
+        parser.add_argument(
+            "--session",
+            action="append",
+            dest="sessions",
+            help="Session id to complete, all pending payments if not set",
+        )
+        parser.add_argument("--limit", type=int, default=1000)
+        parser.add_argument(
+            "--duplicates",
+            type=int,
+            default=1,
+            help="How many times every event is delivered, like Stripe "
+                 "retries do",
+        )
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--secret", default=settings.STRIPE_WEBHOOK_SECRET
+        )
+
+    def handle(self, *args, **options):
+        if not options["secret"]:
+            raise CommandError(
+                "Set STRIPE_WEBHOOK_SECRET or pass --secret"
+            )
+
+        sessions = options["sessions"] or list(
+            Payment.objects.filter(status="PENDING", session_id__isnull=False)
+            .order_by("id")
+            .values_list("session_id", flat=True)[:options["limit"]]
+        )
+        events = [
+            signed_event(
+                checkout_session_completed(session_id), options["secret"]
+            )
+            for session_id in sessions
+        ] * options["duplicates"]
+
+        def send(event):
+            payload, signature = event
+            try:
+                return requests.post(
+                    options["url"],
+                    data=payload,
+                    headers={
+                        "Content-Type": "application/json",
+                        "Stripe-Signature": signature,
+                    },
+                    timeout=30,
+                ).status_code
+            except requests.RequestException as error:
+                return type(error).__name__
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            statuses = Counter(pool.map(send, events))
+        elapsed = time.monotonic() - started
+
+        summary = ", ".join(
+            f"{count} x {status}" for status, count in statuses.items()
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Sent {len(events)} events for {len(sessions)} sessions in "
+                f"{elapsed:.1f}s ({len(events) / max(elapsed, 1e-9):.0f}/s): "
+                f"{summary or 'nothing to send'}"
+            )
+        )
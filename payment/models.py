@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 
 from borrowing.models import Borrowing
 from user.models import User
@@ -8,6 +10,10 @@ class Payment(models.Model):
     STATUS_CHOICES = [
         ("PENDING", "Pending"),
         ("PAID", "Paid"),
+        # no checkout session could be created, see payment.tasks
+        ("FAILED", "Failed"),
+        # paid for a book that was out of stock, an admin refunds it
+        ("NEEDS_REFUND", "Needs refund"),
     ]
 
     TYPE_CHOICES = [
@@ -17,13 +23,23 @@ class Payment(models.Model):
 
     status = models.CharField(max_length=63, choices=STATUS_CHOICES)
     type = models.CharField(max_length=63, choices=TYPE_CHOICES)
+    # both foreign keys are indexed as the first column of a
+    # composite index in Meta
     borrowing = models.ForeignKey(
         Borrowing,
         on_delete=models.CASCADE,
-        related_name="payments"
+        related_name="payments",
+        db_index=False,
+    )
+    # where the checkout sends the browser back, fixed when the payment
+    # is created so every attempt sends the gateway the same request
+    success_url = models.URLField(max_length=500, blank=True)
+    cancel_url = models.URLField(max_length=500, blank=True)
+    # empty until payment.tasks has created the checkout session
+    session_url = models.URLField(max_length=500, blank=True)
+    session_id = models.CharField(
+        max_length=127, unique=True, null=True, blank=True
     )
-    session_url = models.URLField(max_length=500)
-    session_id = models.CharField(max_length=127, unique=True)
     money_to_pay = models.DecimalField(
         max_digits=7,
         decimal_places=2,
@@ -32,8 +48,30 @@ class Payment(models.Model):
     user = models.ForeignKey(
         User,
         related_name="payments",
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False,
     )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # pending payments of a user before a new borrowing
+            models.Index(
+                fields=["user", "status"],
+                name="payment_user_status_idx",
+            ),
+            # pending payment of a borrowing before its return
+            models.Index(
+                fields=["borrowing", "status"],
+                name="payment_borrowing_status_idx",
+            ),
+            # payments still waiting for a checkout session
+            models.Index(
+                fields=["created_at"],
+                condition=Q(status="PENDING", session_id__isnull=True),
+                name="payment_unopened_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Payment #{self.id} - {self.status} by {self.user.email}"
@@ -0,0 +1,85 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import (
+    DateField,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest, Round
+from django.utils import timezone
+
+from borrowing.models import DateDiff
+
+CENT = Decimal("0.01")
+FINE_MULTIPLIER = Decimal("1.5")
+
+# Prices are rounded to cents half away from zero, like round() on a
+# numeric in Postgres, so both ways of pricing give the same amounts
+MONEY_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def to_money(amount):
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def borrowing_days(borrowing):
+    """Days paid upfront, the day of borrowing included"""
+    return (borrowing.expected_return_date - borrowing.borrow_date).days + 1
+
+
+def overdue_days(borrowing, today=None):
+    """Days past the expected return date, until the return or today"""
+    returned = (
+        borrowing.actual_return_date or today or timezone.localdate()
+    )
+    return max((returned - borrowing.expected_return_date).days, 0)
+
+
+def start_price(borrowing):
+    return to_money(borrowing_days(borrowing) * borrowing.book.daily)
+
+
+def fine_price(borrowing, today=None):
+    return to_money(
+        overdue_days(borrowing, today) * borrowing.book.daily * FINE_MULTIPLIER
+    )
+
+
+def with_prices(queryset, today=None):
+    """
+    Annotates borrowings with start_price, fine_price (accrued until
+    the return or today) and money_due, their sum, computed by the
+    database for the whole queryset
+    """
+    today = today or timezone.localdate()
+    daily = F("book__daily")
+
+    start = ExpressionWrapper(
+        (DateDiff("expected_return_date", "borrow_date") + 1) * daily,
+        output_field=MONEY_FIELD,
+    )
+    overdue = Greatest(
+        DateDiff(
+            Coalesce(
+                "actual_return_date",
+                Value(today, output_field=DateField()),
+            ),
+            "expected_return_date",
+        ),
+        0,
+    )
+    fine = ExpressionWrapper(
+        overdue * daily * Value(FINE_MULTIPLIER, output_field=MONEY_FIELD),
+        output_field=MONEY_FIELD,
+    )
+
+    return queryset.annotate(
+        start_price=Round(start, 2),
+        fine_price=Round(fine, 2),
+    ).annotate(
+        money_due=ExpressionWrapper(
+            F("start_price") + F("fine_price"), output_field=MONEY_FIELD
+        ),
+    )
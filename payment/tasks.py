@@ -0,0 +1,144 @@
+import logging
+from datetime import timedelta
+from urllib.parse import urljoin
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from library.inventory import take_book
+from notifications.bot_commands import (
+    send_borrowing_notification,
+    send_payment_notification,
+    send_refund_notification,
+)
+from payment.models import Payment
+from payment.gateways import GatewayError, GatewayUnavailable, get_gateway
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def confirm_payment(session_id):
+    """
+    Marks the payment of a paid checkout session as PAID. Stripe may
+    deliver an event more than once and concurrently, only the update
+    that flips PENDING to PAID applies the effects of the payment. A
+    payment for a book that is out of stock is marked NEEDS_REFUND.
+    Returns whether this call confirmed it
+    """
+    with transaction.atomic():
+        confirmed = Payment.objects.filter(
+            session_id=session_id, status="PENDING"
+        ).update(status="PAID")
+        if not confirmed:
+            return False
+
+        payment = Payment.objects.select_related(
+            "borrowing__book", "user"
+        ).get(session_id=session_id)
+
+        if payment.type == "PAYMENT" and not take_book(
+            payment.borrowing.book
+        ):
+            # Stripe won't send the event again, the payment has to stay
+            # on record until an admin refunds it
+            Payment.objects.filter(id=payment.id).update(
+                status="NEEDS_REFUND"
+            )
+            logger.error(
+                "Payment #%s was paid but %r is out of stock",
+                payment.id,
+                payment.borrowing.book.title,
+            )
+            send_refund_notification(payment)
+            return False
+
+        send_payment_notification(payment.user, payment)
+
+    return True
+
+
+@shared_task(
+    autoretry_for=(GatewayUnavailable,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def open_checkout_session(payment_id, base_url):
+    """
+    Creates the checkout session of a pending payment and sends its
+    link, a short link on base_url, to the user. A retry sends the
+    gateway the URLs stored on the payment again and gets the same
+    session back, and a payment that already has one is left alone. A
+    payment the gateway refuses is marked FAILED
+    """
+    payment = (
+        Payment.objects.select_related("borrowing__book", "user")
+        .filter(id=payment_id, status="PENDING", session_id__isnull=True)
+        .first()
+    )
+    if payment is None:
+        return None
+
+    try:
+        session = get_gateway().create_checkout_session(
+            payment, payment.success_url, payment.cancel_url
+        )
+    except GatewayError as error:
+        Payment.objects.filter(
+            id=payment.id, status="PENDING", session_id__isnull=True
+        ).update(status="FAILED")
+        logger.error(
+            "No checkout session for payment #%s: %s", payment.id, error
+        )
+        return None
+
+    with transaction.atomic():
+        updated = Payment.objects.filter(
+            id=payment.id, session_id__isnull=True
+        ).update(session_id=session.id, session_url=session.url)
+        if updated and payment.type == "PAYMENT":
+            payment.session_id = session.id
+            payment.session_url = session.url
+            send_borrowing_notification(payment, base_url)
+
+    return session.id
+
+
+def checkout_urls(borrowing_id, base_url):
+    """Where Stripe sends the browser after the checkout of a borrowing"""
+    # Stripe fills in the id of the session
+    success_url = urljoin(
+        base_url, reverse("payment:payment-success", args=[borrowing_id])
+    ) + "?session_id={CHECKOUT_SESSION_ID}"
+    cancel_url = urljoin(
+        base_url, reverse("payment:payment-cancel", args=[borrowing_id])
+    )
+    return success_url, cancel_url
+
+
+@shared_task
+def reopen_checkout_sessions():
+    """
+    Queues open_checkout_session again for the pending payments still
+    without a session CHECKOUT_RECOVERY_DELAY seconds after they were
+    created: the broker was down when they committed, or the gateway
+    stayed unavailable through all retries. Their short links go to
+    CHECKOUT_BASE_URL, no request is left to take the host from
+    """
+    created_before = timezone.now() - timedelta(
+        seconds=settings.CHECKOUT_RECOVERY_DELAY
+    )
+    payments = Payment.objects.filter(
+        status="PENDING",
+        session_id__isnull=True,
+        created_at__lt=created_before,
+    ).values_list("id", flat=True)
+
+    reopened = 0
+    for payment_id in payments.iterator():
+        open_checkout_session.delay(payment_id, settings.CHECKOUT_BASE_URL)
+        reopened += 1
+    return reopened
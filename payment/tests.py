@@ -0,0 +1,623 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+import stripe
+
+from borrowing.models import Borrowing
+from library.models import Book
+from library_config.testing import TestCase, TransactionTestCase
+from payment.fake_events import (
+    checkout_session_completed,
+    sign_payload,
+    signed_event,
+)
+from payment.gateways import (
+    FakeGateway,
+    GatewayError,
+    GatewayUnavailable,
+    PaymentGateway,
+    StripeGateway,
+    get_gateway,
+)
+from payment.models import Payment
+from payment.pricing import (
+    fine_price,
+    overdue_days,
+    start_price,
+    with_prices,
+)
+from payment.tasks import (
+    checkout_urls,
+    confirm_payment,
+    open_checkout_session,
+    reopen_checkout_sessions,
+)
+from shortener.models import ShortLink
+
+BORROWING_URL = reverse("borrowing:borrowing-list")
+OUTSTANDING_URL = reverse("payment:payment-outstanding")
+WEBHOOK_URL = reverse("payment:stripe-webhook")
+WEBHOOK_SECRET = "whsec_test"
+
+
+def sample_payment(session_id="cs_test_1", **params):
+    user = get_user_model().objects.create_user(
+        f"{session_id}@test.com", "pass"
+    )
+    book = Book.objects.create(
+        title="Sample book",
+        author="Sample author",
+        cover="H",
+        inventory=5,
+        daily=2,
+    )
+    borrowing = Borrowing.objects.create(
+        book=book,
+        user=user,
+        expected_return_date=timezone.localdate() + timedelta(days=3),
+    )
+    defaults = {
+        "status": "PENDING",
+        "type": "PAYMENT",
+        "borrowing": borrowing,
+        "session_url": "https://checkout.stripe.com/pay/" + session_id,
+        "session_id": session_id,
+        "money_to_pay": 8,
+        "user": user,
+    }
+    defaults.update(params)
+
+    return Payment.objects.create(**defaults)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        patcher = mock.patch("payment.views.confirm_payment")
+        self.task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_event(self, event, secret=WEBHOOK_SECRET):
+        payload, signature = signed_event(event, secret)
+        return self.client.post(
+            WEBHOOK_URL,
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=signature,
+        )
+
+    def test_paid_session_is_confirmed_by_a_task(self):
+        res = self.post_event(checkout_session_completed("cs_test_1"))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.task.delay.assert_called_once_with("cs_test_1")
+
+    def test_wrong_signature_is_rejected(self):
+        res = self.post_event(
+            checkout_session_completed("cs_test_1"), secret="whsec_other"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.task.delay.assert_not_called()
+
+    def test_stale_signature_is_rejected(self):
+        payload = json.dumps(checkout_session_completed("cs_test_1"))
+
+        res = self.client.post(
+            WEBHOOK_URL,
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=sign_payload(
+                payload, WEBHOOK_SECRET, timestamp=0
+            ),
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unpaid_session_is_ignored(self):
+        event = checkout_session_completed("cs_test_1")
+        event["data"]["object"]["payment_status"] = "unpaid"
+
+        res = self.post_event(event)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.task.delay.assert_not_called()
+
+    @override_settings(STRIPE_WEBHOOK_SECRET="")
+    def test_webhook_needs_a_secret(self):
+        res = self.post_event(checkout_session_completed("cs_test_1"), "")
+
+        self.assertEqual(
+            res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        self.task.delay.assert_not_called()
+
+
+class ConfirmPaymentTests(TestCase):
+    def test_payment_is_confirmed_once(self):
+        payment = sample_payment()
+
+        with mock.patch(
+            "payment.tasks.send_payment_notification"
+        ) as notification:
+            self.assertTrue(confirm_payment(payment.session_id))
+            self.assertFalse(confirm_payment(payment.session_id))
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "PAID")
+        self.assertEqual(payment.borrowing.book.inventory, 4)
+        notification.assert_called_once()
+
+    def test_fine_does_not_take_a_book(self):
+        payment = sample_payment(type="FINE")
+
+        self.assertTrue(confirm_payment(payment.session_id))
+
+        payment.borrowing.book.refresh_from_db()
+        self.assertEqual(payment.borrowing.book.inventory, 5)
+
+    def test_out_of_stock_payment_needs_refund(self):
+        payment = sample_payment()
+        Book.objects.update(inventory=0)
+
+        with self.assertLogs("payment.tasks", "ERROR"), mock.patch(
+            "payment.tasks.send_refund_notification"
+        ) as notification:
+            self.assertFalse(confirm_payment(payment.session_id))
+            self.assertFalse(confirm_payment(payment.session_id))
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "NEEDS_REFUND")
+        notification.assert_called_once()
+
+    def test_unknown_session_is_ignored(self):
+        self.assertFalse(confirm_payment("cs_unknown"))
+
+
+class ConfirmPaymentConcurrencyTests(TransactionTestCase):
+    def test_duplicate_deliveries_apply_once(self):
+        payment = sample_payment()
+
+        def deliver(_):
+            try:
+                return confirm_payment(payment.session_id)
+            finally:
+                connection.close()
+
+        with mock.patch("notifications.outbox.drain_outbox"), \
+                ThreadPoolExecutor(max_workers=8) as executor:
+            confirmed = list(executor.map(deliver, range(8)))
+
+        self.assertEqual(confirmed.count(True), 1)
+        payment.borrowing.book.refresh_from_db()
+        self.assertEqual(payment.borrowing.book.inventory, 4)
+
+
+class SuccessPaymentViewTests(TestCase):
+    def test_success_page_does_not_change_the_payment(self):
+        payment = sample_payment()
+        url = reverse("payment:payment-success", args=[payment.borrowing_id])
+
+        res = APIClient().get(url, {"session_id": payment.session_id})
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "PENDING")
+
+    def test_failed_payment_is_reported(self):
+        payment = sample_payment(status="FAILED")
+        url = reverse("payment:payment-success", args=[payment.borrowing_id])
+
+        res = APIClient().get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+
+class FakeStripeEventsCommandTests(TestCase):
+    def test_sends_signed_events_for_pending_payments(self):
+        payment = sample_payment()
+        sample_payment("cs_test_2", status="PAID")
+
+        with mock.patch(
+            "payment.management.commands.fake_stripe_events.requests.post"
+        ) as post:
+            post.return_value.status_code = 200
+            call_command(
+                "fake_stripe_events",
+                secret=WEBHOOK_SECRET,
+                duplicates=2,
+                stdout=StringIO(),
+            )
+
+        self.assertEqual(post.call_count, 2)
+        body = json.loads(post.call_args.kwargs["data"])
+        self.assertEqual(body["data"]["object"]["id"], payment.session_id)
+
+
+class CheckoutSessionTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            "stripe.checkout.Session.create",
+            return_value=SimpleNamespace(
+                id="cs_test_new", url="https://checkout.stripe.com/c/new"
+            ),
+        )
+        self.create_session = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_borrowing_is_committed_before_the_session(self):
+        client = APIClient()
+        client.force_authenticate(
+            get_user_model().objects.create_user("user@test.com", "pass")
+        )
+        book = Book.objects.create(
+            title="Sample book",
+            author="Sample author",
+            cover="H",
+            inventory=5,
+            daily=2,
+        )
+
+        with mock.patch("payment.checkout.open_checkout_session") as task, \
+                self.captureOnCommitCallbacks(execute=True):
+            res = client.post(
+                BORROWING_URL,
+                {
+                    "book": book.id,
+                    "expected_return_date": (
+                        timezone.localdate() + timedelta(days=3)
+                    ),
+                },
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.create_session.assert_not_called()
+        payment = Payment.objects.get()
+        self.assertEqual(payment.session_url, "")
+        self.assertIsNone(payment.session_id)
+        self.assertEqual(payment.money_to_pay, 8)
+        task.delay.assert_called_once_with(payment.id, "http://testserver/")
+        self.assertEqual(
+            (payment.success_url, payment.cancel_url),
+            checkout_urls(payment.borrowing_id, "http://testserver/"),
+        )
+
+    def test_session_is_created_once(self):
+        payment = sample_payment()
+        Payment.objects.update(session_id=None, session_url="")
+        args = (payment.id, "http://testserver/")
+
+        self.assertEqual(open_checkout_session(*args), "cs_test_new")
+        self.assertIsNone(open_checkout_session(*args))
+
+        self.create_session.assert_called_once()
+        self.assertEqual(
+            self.create_session.call_args.kwargs["idempotency_key"],
+            f"payment-{payment.id}",
+        )
+        self.assertEqual(
+            self.create_session.call_args.kwargs["line_items"][0][
+                "price_data"
+            ]["unit_amount"],
+            800,
+        )
+        payment.refresh_from_db()
+        self.assertEqual(payment.session_id, "cs_test_new")
+        self.assertEqual(
+            ShortLink.objects.get().url, "https://checkout.stripe.com/c/new"
+        )
+
+    def test_refused_payment_fails(self):
+        payment = sample_payment()
+        Payment.objects.update(session_id=None, session_url="")
+        self.create_session.side_effect = stripe.error.InvalidRequestError(
+            "Invalid amount", "line_items"
+        )
+
+        with self.assertLogs("payment.tasks", "ERROR"):
+            self.assertIsNone(
+                open_checkout_session(payment.id, "http://t/")
+            )
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "FAILED")
+
+    @override_settings(CHECKOUT_BASE_URL="https://library.test/")
+    def test_lost_sessions_are_queued_again(self):
+        lost = sample_payment("cs_lost")
+        sample_payment("cs_recent")
+        sample_payment("cs_opened")
+        Payment.objects.exclude(session_id="cs_opened").update(
+            session_id=None, session_url=""
+        )
+        Payment.objects.filter(id=lost.id).update(
+            created_at=timezone.now() - timedelta(hours=1)
+        )
+
+        with mock.patch("payment.tasks.open_checkout_session") as task:
+            self.assertEqual(reopen_checkout_sessions(), 1)
+
+        task.delay.assert_called_once_with(lost.id, "https://library.test/")
+
+    def test_retry_sends_the_urls_of_the_first_attempt(self):
+        payment = sample_payment(
+            success_url="http://first.test/success/",
+            cancel_url="http://first.test/cancel/",
+        )
+        Payment.objects.update(session_id=None, session_url="")
+
+        open_checkout_session(payment.id, "https://library.test/")
+
+        kwargs = self.create_session.call_args.kwargs
+        self.assertEqual(kwargs["success_url"], "http://first.test/success/")
+        self.assertEqual(kwargs["cancel_url"], "http://first.test/cancel/")
+
+
+class PaymentGatewayTests(TestCase):
+    def test_fake_gateway_is_deterministic(self):
+        payment = sample_payment()
+
+        def outcomes(gateway):
+            results = []
+            for _ in range(20):
+                try:
+                    results.append(
+                        gateway.create_checkout_session(
+                            payment, "http://s/", "http://c/"
+                        ).id
+                    )
+                except GatewayUnavailable:
+                    results.append(None)
+            return results
+
+        first = outcomes(FakeGateway(seed=7, failure_rate=0.5))
+        second = outcomes(FakeGateway(seed=7, failure_rate=0.5))
+
+        self.assertEqual(first, second)
+        self.assertIn(None, first)
+        self.assertIn(f"cs_fake_{payment.id}", first)
+
+    def test_gateway_must_create_sessions(self):
+        class IncompleteGateway(PaymentGateway):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteGateway()
+
+    def test_fake_gateway_failures(self):
+        payment = sample_payment()
+
+        with self.assertRaises(GatewayUnavailable):
+            FakeGateway(failure_rate=1).create_checkout_session(
+                payment, "http://s/", "http://c/"
+            )
+
+    def test_stripe_connection_errors_can_be_retried(self):
+        payment = sample_payment()
+
+        with mock.patch(
+            "stripe.checkout.Session.create",
+            side_effect=stripe.error.APIConnectionError("timeout"),
+        ), self.assertRaises(GatewayUnavailable):
+            StripeGateway().create_checkout_session(
+                payment, "http://s/", "http://c/"
+            )
+
+    def test_stripe_request_errors_are_final(self):
+        payment = sample_payment()
+
+        with mock.patch(
+            "stripe.checkout.Session.create",
+            side_effect=stripe.error.AuthenticationError("bad key"),
+        ), self.assertRaises(GatewayError):
+            StripeGateway().create_checkout_session(
+                payment, "http://s/", "http://c/"
+            )
+
+    def test_gateway_is_chosen_by_settings(self):
+        self.assertIsInstance(get_gateway(), StripeGateway)
+
+        with override_settings(
+            PAYMENT_GATEWAY={
+                "BACKEND": "payment.gateways.FakeGateway",
+                "OPTIONS": {"latency": 0},
+            }
+        ):
+            self.assertIsInstance(get_gateway(), FakeGateway)
+            self.assertIs(get_gateway(), get_gateway())
+
+
+class PricingTests(TestCase):
+    TODAY = date(2024, 3, 20)
+
+    def borrowing(self, daily, days, overdue=0, returned=True):
+        expected = self.TODAY - timedelta(days=overdue)
+        return Borrowing(
+            book=Book(daily=Decimal(daily)),
+            borrow_date=expected - timedelta(days=days - 1),
+            expected_return_date=expected,
+            actual_return_date=self.TODAY if returned else None,
+        )
+
+    def test_start_price_is_exact(self):
+        # int(0.29 * 100) is 28 with floats
+        self.assertEqual(
+            start_price(self.borrowing("0.29", 1)), Decimal("0.29")
+        )
+        self.assertEqual(
+            start_price(self.borrowing("19.99", 3)), Decimal("59.97")
+        )
+
+    def test_fine_is_rounded_half_up(self):
+        borrowing = self.borrowing("0.33", 2, overdue=1)
+
+        self.assertEqual(overdue_days(borrowing), 1)
+        self.assertEqual(fine_price(borrowing), Decimal("0.50"))
+
+    def test_fine_of_active_borrowing_accrues_until_today(self):
+        borrowing = self.borrowing("2.00", 3, overdue=4, returned=False)
+
+        self.assertEqual(fine_price(borrowing, self.TODAY), Decimal("12.00"))
+        self.assertEqual(
+            fine_price(self.borrowing("2.00", 3)), Decimal("0.00")
+        )
+
+    def test_queryset_prices_match_python_prices(self):
+        user = get_user_model().objects.create_user("user@test.com")
+        cases = [
+            ("0.29", 1, 0, True),
+            ("0.33", 2, 1, True),
+            ("19.99", 14, 9, False),
+            ("7.05", 5, 0, False),
+        ]
+        for daily, days, overdue, returned in cases:
+            borrowing = self.borrowing(daily, days, overdue, returned)
+            borrowing.book = Book.objects.create(
+                title="Sample book",
+                author="Sample author",
+                cover="H",
+                inventory=1,
+                daily=Decimal(daily),
+            )
+            borrowing.user = user
+            borrowing.save()
+            Borrowing.objects.filter(id=borrowing.id).update(
+                borrow_date=borrowing.borrow_date
+            )
+
+        with self.assertNumQueries(1):
+            priced = list(
+                with_prices(Borrowing.objects.all(), self.TODAY)
+                .select_related("book")
+                .order_by("id")
+            )
+
+        for borrowing in priced:
+            self.assertEqual(borrowing.start_price, start_price(borrowing))
+            self.assertEqual(
+                borrowing.fine_price, fine_price(borrowing, self.TODAY)
+            )
+            self.assertEqual(
+                borrowing.money_due,
+                borrowing.start_price + borrowing.fine_price,
+            )
+
+
+class OutstandingPaymentsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_superuser(
+                "admin@test.com", "pass"
+            )
+        )
+        self.today = timezone.localdate()
+
+        # pending start payment of 8.00 for the first user
+        self.pending = sample_payment("cs_pending")
+        self.reader = self.pending.user
+        # 2 overdue days of a 3.00 book: 9.00 accrued fine
+        self.book = Book.objects.create(
+            title="Overdue book",
+            author="Sample author",
+            cover="H",
+            inventory=1,
+            daily=3,
+        )
+        overdue = Borrowing.objects.create(
+            book=self.book,
+            user=self.reader,
+            expected_return_date=self.today - timedelta(days=2),
+        )
+        Borrowing.objects.filter(id=overdue.id).update(
+            borrow_date=self.today - timedelta(days=5)
+        )
+        # paid payments are not owed
+        sample_payment("cs_paid", status="PAID")
+
+    def test_outstanding_by_user(self):
+        with self.assertNumQueries(2):
+            res = self.client.get(OUTSTANDING_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data["results"],
+            [
+                {
+                    "user_id": self.reader.id,
+                    "email": self.reader.email,
+                    "pending": Decimal("8.00"),
+                    "pending_payments": 1,
+                    "accrued_fines": Decimal("9.00"),
+                    "overdue_borrowings": 1,
+                    "total": Decimal("17.00"),
+                }
+            ],
+        )
+        self.assertEqual(res.data["totals"]["total"], Decimal("17.00"))
+
+    def test_outstanding_by_book(self):
+        res = self.client.get(OUTSTANDING_URL, {"group_by": "book"})
+
+        self.assertEqual(
+            [(row["title"], row["total"]) for row in res.data["results"]],
+            [
+                ("Overdue book", Decimal("9.00")),
+                ("Sample book", Decimal("8.00")),
+            ],
+        )
+
+    def test_outstanding_by_day(self):
+        res = self.client.get(OUTSTANDING_URL, {"group_by": "day"})
+
+        self.assertEqual(
+            [(row["day"], row["total"]) for row in res.data["results"]],
+            [
+                (self.today - timedelta(days=2), Decimal("9.00")),
+                (self.today, Decimal("8.00")),
+            ],
+        )
+
+    def test_unknown_group_is_rejected(self):
+        res = self.client.get(OUTSTANDING_URL, {"group_by": "month"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_outstanding_is_admin_only(self):
+        self.client.force_authenticate(self.reader)
+
+        res = self.client.get(OUTSTANDING_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+            }
+        }
+    )
+    def test_outstanding_is_cached(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.get(OUTSTANDING_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(OUTSTANDING_URL)
+
+        self.assertEqual(res.data["totals"]["total"], Decimal("17.00"))
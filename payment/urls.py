@@ -5,12 +5,19 @@ from payment.views import (
     PaymentViewSet,
     SuccessPaymentView,
     CancelPaymentView,
+    StripeWebhookView,
 )
 
 router = routers.DefaultRouter()
 router.register("", PaymentViewSet)
 
 urlpatterns = [
+    # before the router, whose detail route would match it
+    path(
+        "webhook/",
+        StripeWebhookView.as_view(),
+        name="stripe-webhook"
+    ),
     path("", include(router.urls)),
     path(
         "<int:pk>/success/",
@@ -1,12 +1,16 @@
-import datetime
-
-from drf_spectacular.utils import extend_schema
+import stripe
+from django.conf import settings
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from borrowing.models import Borrowing
-from notifications.bot_commands import send_payment_notification
+from borrowing.pagination import KeysetCursorPagination
+from payment.ledger import GROUPS, get_outstanding
 from payment.models import Payment
 
 from payment.serializers import (
@@ -14,8 +18,19 @@ from payment.serializers import (
     PaymentListSerializer,
     PaymentDetailSerializer,
 )
+from payment.tasks import confirm_payment
 from user.permissions import IsAdminOrIfAuthenticatedReadOnly
 
+# events of a checkout session whose money has arrived
+PAID_SESSION_EVENTS = {
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+}
+
+
+class PaymentListPagination(KeysetCursorPagination):
+    ordering = "-id"
+
 
 class PaymentViewSet(
     mixins.ListModelMixin,
@@ -27,18 +42,23 @@ class PaymentViewSet(
     permission_classes = [
         IsAdminOrIfAuthenticatedReadOnly,
     ]
+    pagination_class = PaymentListPagination
 
     def get_queryset(self):
         queryset = self.queryset
 
         if self.action == "list":
-            queryset = Payment.objects.select_related("user", "borrowing")
+            queryset = Payment.objects.select_related(
+                "user", "borrowing__book"
+            )
 
             if not self.request.user.is_staff:
                 queryset = queryset.filter(user=self.request.user)
 
         if self.action == "retrieve":
-            queryset = Payment.objects.select_related("user", "borrowing")
+            queryset = Payment.objects.select_related(
+                "user", "borrowing__book"
+            )
 
         return queryset
 
@@ -67,40 +87,135 @@ class PaymentViewSet(
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
+    @extend_schema(
+        description="Money owed to the library: pending payments plus "
+        "fines accrued on books not returned yet, largest total first. "
+        "Refreshed once a minute (For admin)",
+        parameters=[
+            OpenApiParameter(
+                "group_by",
+                type=str,
+                enum=GROUPS,
+                description="Group by user, book or the day the money "
+                            "fell due (default user)",
+            ),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="outstanding",
+        permission_classes=[IsAdminUser],
+    )
+    def outstanding(self, request):
+        group_by = request.query_params.get("group_by", "user")
+        if group_by not in GROUPS:
+            raise ValidationError(
+                {"group_by": f"Choose from: {', '.join(GROUPS)}"}
+            )
+        return Response(get_outstanding(group_by))
+
 
 class SuccessPaymentView(APIView):
+    """
+    Where Stripe sends the browser after checkout. Only reports the
+    status, the payment is confirmed by StripeWebhookView
+    """
+
     @extend_schema(
-        description="Confirm payment by id (For admin)",
+        description="Get the status of the payment of a borrowing",
+        parameters=[
+            OpenApiParameter(
+                "session_id",
+                type=str,
+                description="Checkout session, the latest payment of the "
+                            "borrowing if not set",
+            ),
+        ],
     )
     def get(self, request, *args, **kwargs):
-        borrowing_id = kwargs.get("pk")
+        payments = Payment.objects.filter(borrowing_id=kwargs.get("pk"))
+        session_id = request.query_params.get("session_id")
+        if session_id:
+            payments = payments.filter(session_id=session_id)
+        payment = payments.order_by("-id").first()
 
-        borrowing = Borrowing.objects.filter(id=borrowing_id).first()
-        payment = Payment.objects.filter(borrowing_id=borrowing_id).first()
+        if payment is None:
+            return Response(
+                {"message": "Payment not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        if payment.status == "PAID":
+            return Response(
+                {"message": "Payment of the borrowed book was successful."},
+                status=status.HTTP_200_OK,
+            )
+        if payment.status == "NEEDS_REFUND":
+            return Response(
+                {"message": "The book is out of stock, "
+                            "your payment will be refunded."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if payment.status == "FAILED":
+            return Response(
+                {"message": "The payment could not be started, "
+                            "please contact the library."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(
+            {"message": "The payment is being confirmed, "
+                        "you will be notified once it is done."},
+            status=status.HTTP_202_ACCEPTED,
+        )
 
-        if payment and borrowing:
-            payment.status = "PAID"
-            if borrowing.payments.count() == 2:
-                borrowing.actual_return_date = datetime.date.today()
-            if borrowing.payments.count() == 1:
-                borrowing.book.inventory -= 1
-            borrowing.user = self.request.user
-            borrowing.book.save()
-            borrowing.save()
-            payment.save()
 
-            send_payment_notification(borrowing.user, payment)
+class StripeWebhookView(APIView):
+    """
+    Receives Stripe events. The signature is checked here and the
+    payment is confirmed by a Celery task, so Stripe gets its answer
+    right away and retries only if the event couldn't be queued
+    """
 
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    parser_classes = []
+
+    @extend_schema(
+        description="Stripe webhook, the Stripe-Signature header "
+        "must be signed with STRIPE_WEBHOOK_SECRET",
+        request=None,
+        responses={200: None},
+    )
+    def post(self, request, *args, **kwargs):
+        # anyone could sign an event with an empty secret
+        if not settings.STRIPE_WEBHOOK_SECRET:
             return Response(
-                {"message": "Payment of the borrowed book was successful."},
-                status=status.HTTP_200_OK,
+                {"message": "Stripe webhooks are not configured."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
             )
-        else:
+
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body,
+                request.headers.get("Stripe-Signature", ""),
+                settings.STRIPE_WEBHOOK_SECRET,
+            )
+        except (ValueError, stripe.error.SignatureVerificationError):
             return Response(
-                {"message": "Payment not found or already completed."},
+                {"message": "Invalid Stripe event."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        session = event["data"]["object"]
+        if (
+            event["type"] in PAID_SESSION_EVENTS
+            and session.get("payment_status") == "paid"
+        ):
+            confirm_payment.delay(session["id"])
+
+        return Response(status=status.HTTP_200_OK)
+
 
 class CancelPaymentView(APIView):
     @extend_schema(
@@ -0,0 +1,6 @@
+from django.contrib import admin
+
+from shortener.models import ShortLink
+
+
+admin.site.register(ShortLink)
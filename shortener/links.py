@@ -0,0 +1,35 @@
+from functools import lru_cache
+from urllib.parse import urljoin
+
+from django.urls import reverse
+
+from shortener.models import ShortLink
+from shortener.utils import decode
+
+RESOLVED_CODES_CACHE_SIZE = 4096
+
+
+def shorten(url, base_url):
+    """
+    Creates a short link for url and returns its address on base_url,
+    the root URL of the site
+    """
+    link = ShortLink.objects.create(url=url)
+    return urljoin(base_url, reverse("shortener:redirect", args=[link.code]))
+
+
+@lru_cache(maxsize=RESOLVED_CODES_CACHE_SIZE)
+def _resolve(code):
+    # Misses raise instead of returning None, so lru_cache never keeps
+    # them and unknown codes can't push real links out of the cache.
+    return ShortLink.objects.values_list("url", flat=True).get(
+        pk=decode(code)
+    )
+
+
+def resolve(code):
+    """Returns the url behind code, or None if there is no such link"""
+    try:
+        return _resolve(code)
+    except (ValueError, ShortLink.DoesNotExist):
+        return None
@@ -0,0 +1,15 @@
+from django.db import models
+
+from shortener.utils import encode
+
+
+class ShortLink(models.Model):
+    url = models.URLField(max_length=500)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def code(self):
+        return encode(self.id)
+
+    def __str__(self):
+        return f"{self.code} -> {self.url}"
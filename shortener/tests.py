@@ -0,0 +1,61 @@
+from django.urls import reverse
+
+from library_config.testing import TestCase
+from shortener.links import _resolve, resolve
+from shortener.models import ShortLink
+from shortener.utils import decode, encode
+
+LONG_URL = "https://checkout.stripe.com/c/pay/cs_test_a1b2c3"
+
+
+def redirect_url(code):
+    return reverse("shortener:redirect", args=[code])
+
+
+class ShortCodeTests(TestCase):
+    def test_codes_are_deterministic_and_reversible(self):
+        for number in (1, 2, 62, 10 ** 6, 10 ** 12):
+            code = encode(number)
+            self.assertEqual(code, encode(number))
+            self.assertEqual(decode(code), number)
+
+    def test_consecutive_ids_get_unrelated_codes(self):
+        self.assertNotEqual(encode(1)[:3], encode(2)[:3])
+
+    def test_decode_rejects_malformed_codes(self):
+        with self.assertRaises(ValueError):
+            decode("abc")
+        with self.assertRaises(ValueError):
+            decode("abc-def")
+
+
+class ShortLinkRedirectTests(TestCase):
+    def setUp(self):
+        _resolve.cache_clear()
+        self.link = ShortLink.objects.create(url=LONG_URL)
+
+    def test_redirects_to_original_url(self):
+        response = self.client.get(redirect_url(self.link.code))
+
+        self.assertRedirects(
+            response, LONG_URL, fetch_redirect_response=False
+        )
+
+    def test_unknown_code_returns_not_found(self):
+        response = self.client.get(redirect_url(encode(self.link.id + 1)))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_resolved_codes_are_served_from_memory(self):
+        resolve(self.link.code)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve(self.link.code), LONG_URL)
+
+    def test_misses_are_not_cached(self):
+        code = encode(self.link.id + 1)
+        self.assertIsNone(resolve(code))
+
+        ShortLink.objects.create(url=LONG_URL)
+
+        self.assertEqual(resolve(code), LONG_URL)
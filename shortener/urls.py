@@ -0,0 +1,9 @@
+from django.urls import path
+
+from shortener.views import redirect_short_link
+
+urlpatterns = [
+    path("<str:code>", redirect_short_link, name="redirect"),
+]
+
+app_name = "shortener"
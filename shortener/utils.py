@@ -0,0 +1,33 @@
+import string
+
+ALPHABET = string.digits + string.ascii_letters
+CODE_LENGTH = 7
+MODULUS = len(ALPHABET) ** CODE_LENGTH
+
+# Ids are scrambled with a fixed multiplier coprime to MODULUS, so codes
+# stay deterministic and reversible but consecutive links don't get
+# consecutive codes.
+MULTIPLIER = 2_176_458_523_711
+INVERSE = pow(MULTIPLIER, -1, MODULUS)
+
+
+def encode(number: int) -> str:
+    number = number * MULTIPLIER % MODULUS
+    chars = []
+    for _ in range(CODE_LENGTH):
+        number, remainder = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[remainder])
+    return "".join(reversed(chars))
+
+
+def decode(code: str) -> int:
+    if len(code) != CODE_LENGTH:
+        raise ValueError(f"Short code must be {CODE_LENGTH} characters")
+
+    number = 0
+    for char in code:
+        index = ALPHABET.find(char)
+        if index < 0:
+            raise ValueError(f"Invalid character in short code: {char}")
+        number = number * len(ALPHABET) + index
+    return number * INVERSE % MODULUS
@@ -0,0 +1,10 @@
+from django.http import Http404, HttpResponseRedirect
+
+from shortener.links import resolve
+
+
+def redirect_short_link(request, code):
+    url = resolve(code)
+    if url is None:
+        raise Http404("Short link not found")
+    return HttpResponseRedirect(url)